@@ -0,0 +1,329 @@
+"""
+Measures the full resolve path of getHistory, getOtpBlob and getHistoryEvents
+against local FakeServer instances across server counts, rotation history
+lengths and failure mixes.
+
+For every combination the wall time, cpu time and peak memory allocated are
+reported together with a breakdown of the wall time into phases:
+
+    transport  sending requests and waiting for responses
+    parse      decoding response bodies and building models with responseFactory
+    verify     signature verification
+    consense   comparing the verified data and counting matches
+
+The phases exclude each other, e.g. verification done while checking
+consensus is only counted as verify.  The servers run in this process so the
+cpu time includes the time they spend answering.  Signature caches are cleared
+before every round so each round verifies from scratch.
+
+Event histories grow quadratically with the number of rotations since every
+event repeats all earlier signers, keep --rotations for events at a few thousand.
+
+    $ python benchmarks/bench_resolve.py
+    $ python benchmarks/bench_resolve.py --servers 3,7,15,31 --rotations 1,100,10000 \
+        --mix clean,errors,timeouts,forged --calls history --json results.json
+    $ python benchmarks/bench_resolve.py --rotations 2000 --calls events --verify thread --workers 4
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+from collections import OrderedDict as ODict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # FakeServer lives in tests.data
+
+from ioflo.aid import getConsole
+from ioflo.aid.consoling import Console
+
+from diderypy.help import consensing
+from diderypy.help import helping as h
+from diderypy.help import signing
+from diderypy.help import transporting as t
+from diderypy.help import verifying
+from diderypy.lib import generating as gen
+from diderypy.lib import historying as hist
+from diderypy.lib import history_eventing as events
+from diderypy.lib import otping as otp
+from diderypy.models import responding
+from tests.data import serving
+
+
+SERVERS = [3, 7, 31]
+ROTATIONS = [1, 100, 1000]
+MIXES = ["clean", "errors", "timeouts", "forged"]
+CALLS = ["history", "otp", "events"]
+VERIFIERS = ["inline", verifying.THREAD, verifying.PROCESS]
+PHASES = ["transport", "parse", "verify", "consense"]
+ROUNDS = 5
+TIMEOUT = 0.5  # seconds allowed for requests when servers time out
+
+
+class Phases:
+    """
+    Phases accumulates exclusive time spent in named phases.  Entering a
+    phase pauses the phase it was entered from until it exits.
+    """
+    def __init__(self):
+        self.times = dict((phase, 0.0) for phase in PHASES)
+        self.stack = []
+
+    def reset(self):
+        self.times = dict((phase, 0.0) for phase in PHASES)
+
+    def enter(self, phase):
+        now = time.perf_counter()
+        if self.stack:
+            outer, start = self.stack[-1]
+            self.times[outer] += now - start
+        self.stack.append([phase, now])
+
+    def exit(self):
+        now = time.perf_counter()
+        phase, start = self.stack.pop()
+        self.times[phase] += now - start
+        if self.stack:
+            self.stack[-1][1] = now
+
+    def wrap(self, phase, func):
+        def wrapper(*args, **kwargs):
+            self.enter(phase)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.exit()
+
+        return wrapper
+
+
+def instrument(phases):
+    """
+    Wraps the library functions that make up each phase so time spent in them is recorded.
+    """
+    h._responseHelper = phases.wrap("parse", h._responseHelper)
+    responding.verify64u = phases.wrap("verify", responding.verify64u)
+    signing.verify64u = phases.wrap("verify", signing.verify64u)
+    verifying.ParallelVerifier.verify = phases.wrap("verify", verifying.ParallelVerifier.verify)
+    consensing.Consense.validateResponse = phases.wrap("consense", consensing.Consense.validateResponse)
+    consensing.CompositeConsense.validateResponse = phases.wrap("consense",
+                                                                consensing.CompositeConsense.validateResponse)
+    consensing.AbstractConsense.checkConsensus = phases.wrap("consense", consensing.AbstractConsense.checkConsensus)
+
+
+def rotationHistory(rotations):
+    """
+    Returns a did, its current history record and its list of events after rotations rotations.
+    Keys are generated from fixed seeds so runs are reproducible.
+    """
+    keys = []
+    for i in range(rotations + 2):
+        vk, sk, did = gen.keyGen(seed=i.to_bytes(32, "big"))
+        keys.append((vk, gen.key64uToKey(sk)))
+
+    did = "did:dad:{}".format(keys[0][0])
+    changed = "2000-01-01T00:00:00+00:00"
+    eventList = []
+
+    for signer in range(rotations + 1):
+        data = {
+            "id": did,
+            "changed": changed,
+            "signer": signer,
+            "signers": [vk for vk, sk in keys[:signer + 2]]
+        }
+        bdata = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+        if signer == 0:
+            signatures = {"signer": signing.signResource(bdata, keys[0][1])}
+        else:
+            signatures = {"signer": signing.signResource(bdata, keys[signer - 1][1]),
+                          "rotation": signing.signResource(bdata, keys[signer][1])}
+
+        eventList.append({"event": data, "signatures": signatures})
+
+    record = {"history": eventList[-1]["event"], "signatures": eventList[-1]["signatures"]}
+
+    return did, record, eventList, keys[0]
+
+
+def otpBlob(did, sk):
+    data = {
+        "id": did,
+        "blob": "AeYbsHot0pmdWAcgTo5sD8iAuSQAfnH5U6wiIGpVNJQQoYKBYrPPxAoIc1i5SHCIDS8KFFgf8i0tDq8XGizaCgo9yjuKHHNJZFi0QD9K6Vpt6fP0XgXlj8z_4D-7s3CcYmuoWAh6NVtYaf_GWw_2sCrHBAA2mAEsml3thLmu50Dw",
+        "changed": "2000-01-01T00:00:00+00:00"
+    }
+    bdata = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+    return {"otp_data": data, "signatures": {"signer": signing.signResource(bdata, sk)}}
+
+
+def startServers(count, mix, did, record, eventList, blob):
+    """
+    Starts count servers holding the same data.  A third of them, rounded down,
+    misbehave according to mix so consensus can still be reached.
+    """
+    servers = []
+    faulty = count // 3
+
+    for i in range(count):
+        server = serving.FakeServer(seed=i)
+        if i < faulty:
+            if mix == "errors":
+                server.errorRate = 1.0
+            elif mix == "timeouts":
+                server.timeoutRate = 1.0
+            elif mix == "forged":
+                server.forgeRate = 1.0
+
+        server.store(serving.HISTORY, did, record)
+        server.store(serving.EVENT, did, eventList)
+        server.store(serving.OTP, did, blob)
+        servers.append(server.start())
+
+    return servers
+
+
+def resolve(call, did, urls):
+    if call == "history":
+        return hist.getHistory(did, urls)
+    if call == "otp":
+        return otp.getOtpBlob(did, urls)
+    return events.getHistoryEvents(did, urls)
+
+
+def clearCaches():
+    signing.verkeys.clear()
+    signing.verdicts.clear()
+
+
+def measure(phases, call, did, urls, rounds):
+    """
+    Returns a dict of mean wall, cpu and phase times over rounds and the peak allocation of one more call.
+    """
+    wall = cpu = 0.0
+    totals = dict((phase, 0.0) for phase in PHASES)
+
+    for i in range(rounds):
+        clearCaches()
+        phases.reset()
+
+        startWall, startCpu = time.perf_counter(), time.process_time()
+        data, results = resolve(call, did, urls)
+        elapsedWall, elapsedCpu = time.perf_counter() - startWall, time.process_time() - startCpu
+
+        if data is None:
+            raise RuntimeError("{} did not reach consensus: {}".format(call, results))
+
+        wall += elapsedWall
+        cpu += elapsedCpu
+        for phase in ("parse", "verify", "consense"):
+            totals[phase] += phases.times[phase]
+        totals["transport"] += elapsedWall - sum(phases.times.values())
+
+    clearCaches()
+    tracemalloc.start()
+    resolve(call, did, urls)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = ODict([("wall", wall / rounds), ("cpu", cpu / rounds), ("peak", peak)])
+    result["phases"] = ODict((phase, totals[phase] / rounds) for phase in PHASES)
+
+    return result
+
+
+def parseList(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark resolving dids against local fake didery servers.")
+    parser.add_argument("--servers", default=",".join(str(n) for n in SERVERS),
+                        help="comma separated server counts")
+    parser.add_argument("--rotations", default=",".join(str(n) for n in ROTATIONS),
+                        help="comma separated rotation history lengths")
+    parser.add_argument("--mix", default=",".join(MIXES), help="comma separated failure mixes: " + ", ".join(MIXES))
+    parser.add_argument("--calls", default=",".join(CALLS), help="comma separated calls: " + ", ".join(CALLS))
+    parser.add_argument("--rounds", type=int, default=ROUNDS, help="rounds averaged for each combination")
+    parser.add_argument("--transport", default=t.IOFLO, choices=t.TRANSPORTS)
+    parser.add_argument("--verify", default="inline", choices=VERIFIERS,
+                        help="verify event chain signatures inline or on a thread or process pool")
+    parser.add_argument("--workers", type=int, help="verifier pool size, defaults to the number of cpus")
+    parser.add_argument("--json", dest="output", help="write results as json to this file, - for stdout")
+    args = parser.parse_args(argv)
+
+    counts = [int(n) for n in parseList(args.servers)]
+    lengths = [int(n) for n in parseList(args.rotations)]
+    mixes = parseList(args.mix)
+    calls = parseList(args.calls)
+
+    for mix in mixes:
+        if mix not in MIXES:
+            parser.error("unknown mix {}".format(mix))
+    for call in calls:
+        if call not in CALLS:
+            parser.error("unknown call {}".format(call))
+
+    getConsole().reinit(verbosity=Console.Wordage.mute)
+    t.setTransport(args.transport)
+    if args.verify != "inline":
+        verifying.setVerifier(verifying.ParallelVerifier(workers=args.workers, executor=args.verify))
+    phases = Phases()
+    instrument(phases)
+
+    report = ODict([
+        ("python", platform.python_version()),
+        ("platform", platform.platform()),
+        ("transport", args.transport),
+        ("verify", args.verify),
+        ("rounds", args.rounds),
+        ("results", [])
+    ])
+
+    text = sys.stderr if args.output == "-" else sys.stdout
+    print("{:>8} {:>7} {:>9} {:>9} {:>10} {:>10} {:>12} {:>11} {:>9} {:>9} {:>9}".format(
+        "call", "servers", "rotations", "mix", "wall ms", "cpu ms", "peak bytes",
+        "transport", "parse", "verify", "consense"), file=text)
+
+    for rotations in lengths:
+        did, record, eventList, (vk, sk) = rotationHistory(rotations)
+        blob = otpBlob(did, sk)
+
+        for count in counts:
+            for mix in mixes:
+                t.setTimeout(TIMEOUT if mix == "timeouts" else t.DEFAULT_TIMEOUT)
+                servers = startServers(count, mix, did, record, eventList, blob)
+                urls = [server.url for server in servers]
+
+                try:
+                    for call in calls:
+                        result = measure(phases, call, did, urls, args.rounds)
+                        result = ODict([("call", call), ("servers", count), ("rotations", rotations),
+                                        ("mix", mix)] + list(result.items()))
+                        report["results"].append(result)
+
+                        print("{:>8} {:>7} {:>9} {:>9} {:>10.2f} {:>10.2f} {:>12} {:>11.2f} {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                            call, count, rotations, mix, result["wall"] * 1000, result["cpu"] * 1000, result["peak"],
+                            *[result["phases"][phase] * 1000 for phase in PHASES]), file=text)
+                finally:
+                    for server in servers:
+                        server.stop()
+                    t.setPool(t.ConnectionPool())
+
+    t.setTimeout(t.DEFAULT_TIMEOUT)
+    verifying.setVerifier(None)
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+    elif args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
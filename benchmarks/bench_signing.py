@@ -0,0 +1,64 @@
+"""
+Compares memory allocated and time taken by signature verification using
+attached signatures (sig + msg passed to crypto_sign_open, the approach
+signing.verify used previously) and detached signatures
+(crypto_sign_verify_detached, used by signing.verify now).
+
+    $ python benchmarks/bench_signing.py
+"""
+import sys
+import time
+import tracemalloc
+
+import libnacl
+
+from diderypy.help import signing
+
+
+SIZES = [1024, 64 * 1024, 1024 * 1024, 8 * 1024 * 1024]
+ROUNDS = 20
+
+
+def verifyAttached(sig, msg, vk):
+    try:
+        result = libnacl.crypto_sign_open(sig + msg, vk)
+    except Exception as ex:
+        return False
+    return True if result else False
+
+
+def measure(func, sig, msg, vk):
+    tracemalloc.start()
+    func(sig, msg, vk)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for i in range(ROUNDS):
+        assert func(sig, msg, vk)
+    elapsed = (time.perf_counter() - start) / ROUNDS
+
+    return peak, elapsed
+
+
+def main():
+    vk, sk = libnacl.crypto_sign_keypair()
+
+    print("{:>10} {:>16} {:>16} {:>12} {:>12}".format(
+        "size", "attached peak", "detached peak", "attached ms", "detached ms"))
+
+    for size in SIZES:
+        msg = b"x" * size
+        sig = libnacl.crypto_sign_detached(msg, sk)
+
+        attachedPeak, attachedTime = measure(verifyAttached, sig, msg, vk)
+        detachedPeak, detachedTime = measure(signing.verify, sig, msg, vk)
+
+        print("{:>10} {:>16} {:>16} {:>12.3f} {:>12.3f}".format(
+            size, attachedPeak, detachedPeak, attachedTime * 1000, detachedTime * 1000))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
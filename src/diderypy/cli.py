@@ -21,6 +21,9 @@ import ioflo.app.run
 from ioflo.aid import odict
 
 from diderypy.help import helping as h
+from diderypy.help import transporting as t
+from diderypy.help import monitoring as m
+from diderypy.help import verifying as v
 from diderypy.diderying import ValidationError
 from diderypy.lib import generating as gen
 
@@ -191,6 +194,9 @@ def main(incept, upload, rotate, update, retrieve, download, delete, remove, eve
         click.echo("Error parsing the config file: {}.".format(err))
         return
 
+    t.configure(configData)
+    m.configure(configData)
+    v.configure(configData)
 
 
     try:
@@ -0,0 +1,260 @@
+"""
+Persistent local cache of consensus data from didery servers.
+
+Data that reached consensus is stored in an sqlite database keyed by did
+together with the ETag and Last-Modified headers each agreeing server sent.
+Later requests to those servers are made conditional so a server whose data
+has not changed can answer with a cheap 304 Not Modified.
+"""
+import inspect
+import sqlite3
+import threading
+import time
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from ioflo.aid import odict
+
+from ..models.consensing import ConsensusResult
+from . import helping as h
+
+
+HISTORY = "history"
+OTP = "blob"
+
+
+class ResponseCache:
+    """
+    ResponseCache stores the last consensus data for each did in an sqlite database.
+    Pass it to historying.getHistory or otping.getOtpBlob with cache=.
+    """
+    def __init__(self, path=":memory:", ttl=0.0, staleIfError=False):
+        """
+        Initialize a ResponseCache object
+
+        :param path: string, sqlite database file path. Defaults to an in memory database
+        :param ttl: float, seconds cached data is returned without contacting the servers.
+                    0 always revalidates with the servers
+        :param staleIfError: bool, return cached data when consensus fails because servers
+                             timed out or errored and no server returned different valid data
+        """
+        if ttl < 0:
+            raise ValueError("ttl cannot be negative")
+
+        self.ttl = ttl
+        self.staleIfError = staleIfError
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+
+        with self._lock, self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                             "did TEXT, kind TEXT, data TEXT, stored REAL, "
+                             "PRIMARY KEY (did, kind))")
+            self._db.execute("CREATE TABLE IF NOT EXISTS validators ("
+                             "did TEXT, kind TEXT, url TEXT, etag TEXT, modified TEXT, "
+                             "PRIMARY KEY (did, kind, url))")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def load(self, did, kind):
+        """
+        Returns (data, stored) for the cached consensus data of did or (None, None).
+
+        :param did: W3C DID string
+        :param kind: HISTORY or OTP
+        """
+        with self._lock:
+            row = self._db.execute("SELECT data, stored FROM entries WHERE did = ? AND kind = ?",
+                                   (did, kind)).fetchone()
+
+        if row is None:
+            return None, None
+
+        return json.loads(row[0]), row[1]
+
+    def fresh(self, did, kind):
+        """
+        Returns the cached data of did if it was stored less than ttl seconds ago otherwise None.
+        """
+        if not self.ttl:
+            return None
+
+        data, stored = self.load(did, kind)
+        if data is None or time.time() - stored >= self.ttl:
+            return None
+
+        return data
+
+    def store(self, did, kind, data, validators=None):
+        """
+        Stores consensus data for did replacing any previous data and validators.
+
+        :param data: dict, data that reached consensus
+        :param validators: dict of url, (etag, last modified) pairs for the servers that returned data
+        """
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                             (did, kind, json.dumps(data, ensure_ascii=False, separators=(",", ":")), time.time()))
+            self._db.execute("DELETE FROM validators WHERE did = ? AND kind = ?", (did, kind))
+            self._db.executemany("INSERT INTO validators VALUES (?, ?, ?, ?, ?)",
+                                 [(did, kind, url, etag, modified)
+                                  for url, (etag, modified) in (validators or {}).items()])
+
+    def delete(self, did, kind):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM entries WHERE did = ? AND kind = ?", (did, kind))
+            self._db.execute("DELETE FROM validators WHERE did = ? AND kind = ?", (did, kind))
+
+    def _validator(self, did, kind, url):
+        with self._lock:
+            return self._db.execute("SELECT etag, modified FROM validators WHERE did = ? AND kind = ? AND url = ?",
+                                    (did, kind, url)).fetchone()
+
+    def request(self, did, kind, url, validators=None):
+        """
+        Returns a request for url like helping.request that is made conditional on the
+        validators stored for the server.  A 304 Not Modified answer is turned into a
+        200 response holding the cached data so it can take part in consensus.
+
+        :param did: W3C DID string
+        :param kind: HISTORY or OTP
+        :param url: full url to query
+        :param validators: optional dict the (etag, last modified) pair of the response
+                           is added to under url once it arrives. Pass it to update.
+                           Each consensus check uses its own dict so concurrent checks
+                           and requests that never complete leave nothing behind
+        """
+        validator = self._validator(did, kind, url)
+        headers = None
+
+        if validator is not None:
+            etag, modified = validator
+            headers = odict([('Accept', 'application/json')])
+            if etag:
+                headers['If-None-Match'] = etag
+            if modified:
+                headers['If-Modified-Since'] = modified
+
+        request = h.request(path=url, headers=headers)
+
+        if validators is None:
+            validators = {}
+
+        if inspect.isgenerator(request):
+            return self._patronRevalidate(did, kind, url, request, validators)
+
+        return self._asyncRevalidate(did, kind, url, request, validators)
+
+    def _patronRevalidate(self, did, kind, url, generator, validators):
+        result = yield from generator
+        return self._revalidate(did, kind, url, result, validators)
+
+    async def _asyncRevalidate(self, did, kind, url, coroutine, validators):
+        return self._revalidate(did, kind, url, await coroutine, validators)
+
+    def _revalidate(self, did, kind, url, result, validators):
+        if not result:
+            return result
+
+        headers = dict((key.lower(), value) for key, value in result.get('headers', {}).items())
+
+        if result.get('status') == 304:
+            data, stored = self.load(did, kind)
+            if data is None:
+                return None
+
+            result = odict(result)
+            result['status'] = 200
+            result['body'] = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+            validator = self._validator(did, kind, url)
+        else:
+            validator = (headers.get('etag'), headers.get('last-modified'))
+
+        if any(validator or ()):
+            validators[url] = validator
+
+        return result
+
+    def update(self, did, kind, consensus, results, validators=None):
+        """
+        Stores the outcome of a consensus check.  Servers that returned the data that reached
+        consensus keep their validators so the next request to them is conditional.
+
+        :param consensus: dict, data that reached consensus or None
+        :param results: dict of url, ConsensusResult pairs
+        :param validators: dict of url, (etag, last modified) pairs filled by the check's requests
+        """
+        agreeing = {}
+
+        for url, result in results.items():
+            validator = (validators or {}).get(url)
+
+            if (validator is not None and result.validation_status == ConsensusResult.VALID
+                    and result.response == consensus):
+                agreeing[url] = validator
+
+        if consensus is not None:
+            self.store(did, kind, consensus, agreeing)
+
+    def stale(self, did, kind, results):
+        """
+        Returns the cached data of did when staleIfError is set and none of the servers
+        returned valid data that differs from it, otherwise None.
+
+        :param results: dict of url, ConsensusResult pairs from a failed consensus check
+        """
+        if not self.staleIfError:
+            return None
+
+        data, stored = self.load(did, kind)
+        if data is None:
+            return None
+
+        for url, result in results.items():
+            if result.validation_status == ConsensusResult.VALID and result.response != data:
+                return None
+
+        return data
+
+    def consense(self, did, kind, urls, consense, quorum=False, selective=False):
+        """
+        Polls urls for did through the cache and checks consensus.
+
+        :param did: W3C DID string
+        :param kind: HISTORY or OTP
+        :param urls: list of server url strings
+        :param consense: Consense obj
+        :param quorum: bool, return as soon as the outcome of consensus is decided
+        :param selective: bool, query the fastest majority first. See Consense.consenseSelective
+        :return: tuple - data and dict of ConsensusResult for each url.
+                 If fresh data was returned from the cache the results dict is empty
+        """
+        data = self.fresh(did, kind)
+        if data is not None:
+            return data, {}
+
+        endpoints = ["{0}/{1}/{2}".format(url, kind, did) for url in urls]
+        validators = {}
+
+        if selective:
+            data, results = consense.consenseSelective(endpoints,
+                                                       lambda endpoint: self.request(did, kind, endpoint, validators))
+        else:
+            generators = dict((endpoint, self.request(did, kind, endpoint, validators)) for endpoint in endpoints)
+
+            if quorum:
+                data, results = consense.consenseAsync(generators)
+            else:
+                data, results = consense.consense(h.awaitAsync(generators, idempotent=True))
+
+        self.update(did, kind, data, results, validators)
+
+        if data is None:
+            data = self.stale(did, kind, results)
+
+        return data, results
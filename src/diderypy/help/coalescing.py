@@ -0,0 +1,69 @@
+"""
+Single flight coalescing of identical concurrent calls.
+
+When several threads resolve the same did from the same servers at the same
+moment only the first call does the work.  The others wait for it and share
+its result instead of sending their own requests to every server.
+"""
+import threading
+
+
+class Flight:
+    """
+    Flight is a call in progress that other callers can wait on.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.shared = 0  # number of callers that waited on this flight
+
+
+class SingleFlight:
+    """
+    SingleFlight runs at most one call per key at a time.  Callers that ask
+    for a key while it is in flight wait for the call and receive the same
+    result, or have the same exception raised.  Shared results are the same
+    objects for every caller and should not be modified.
+    """
+    def __init__(self):
+        self.flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """
+        Returns func(*args, **kwargs) running it only if no call for key is in flight.
+
+        :param key: hashable identifying equivalent calls
+        :param func: callable
+        """
+        with self._lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+
+            if leader:
+                flight = Flight()
+                self.flights[key] = flight
+            else:
+                flight.shared += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func(*args, **kwargs)
+        except BaseException as ex:
+            flight.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self.flights[key]
+            flight.done.set()
+
+        return flight.result
+
+
+flights = SingleFlight()  # shared by historying and otping
@@ -6,14 +6,182 @@ except ImportError:
     import json
 
 from abc import ABC, abstractmethod
-from collections import OrderedDict as ODict
 
 from ..models.consensing import ConsensusResult
+from . import helping
+from . import monitoring
+from . import signing
+from . import transporting
+from . import verifying
 
 
 MAJORITY = 2 / 3
 
 
+def signerOrder(index):
+    """
+    Sort key that orders signer index strings numerically.
+    """
+    return len(index), index
+
+
+class ChainTree:
+    """
+    ChainTree summarizes a chain of rotation events with a hash tree so the chains
+    returned by different servers can be compared without walking every event.
+    Level 0 holds a digest per event in signer order and every level above holds
+    the digest of each complete pair of nodes below it, forming a Merkle mountain
+    range.  Two chains agree on a prefix exactly when the nodes covering it match,
+    so the first event where they diverge is found in O(log n) comparisons.
+    """
+    def __init__(self, events):
+        """
+        Initialize a ChainTree object
+
+        :param events: dict of signer index string, HistoryData pairs
+        """
+        self.indices = sorted(events, key=signerOrder)
+
+        leaves = []
+        for index in self.indices:
+            leaf = sha256(index.encode())
+            leaf.update(b"\x00")
+            leaf.update(events[index].digest)
+            leaves.append(leaf.digest())
+
+        self.levels = [leaves]
+        while len(self.levels[-1]) > 1:
+            below = self.levels[-1]
+            self.levels.append([sha256(below[i] + below[i + 1]).digest() for i in range(0, len(below) - 1, 2)])
+
+    def __len__(self):
+        return len(self.indices)
+
+    @property
+    def root(self):
+        """
+        Digest of the whole chain, the event count followed by the peaks of the range.
+        """
+        digest = sha256(str(len(self)).encode())
+        pos = 0
+
+        for level in reversed(range(len(self.levels))):
+            size = 1 << level
+            if pos + size <= len(self):
+                digest.update(self.levels[level][pos // size])
+                pos += size
+
+        return digest.digest()
+
+    def agreed(self, other):
+        """
+        Returns the number of leading events this chain and other have in common.
+
+        :param other: ChainTree
+        """
+        length = min(len(self), len(other))
+        pos = 0
+
+        for level in reversed(range(min(len(self.levels), len(other.levels)))):
+            size = 1 << level
+            while pos + size <= length and self.levels[level][pos // size] == other.levels[level][pos // size]:
+                pos += size
+
+        return pos
+
+
+def chainChecks(events, known=None):
+    """
+    Walks a chain of rotation events once, checking that it is linked correctly,
+    and returns the signature checks that remain to be done or None if the chain
+    is broken.  Event n must be signed by signer n, list the same signers as the
+    event before it, and use the key that event pre-rotated for its rotation signature.
+
+    :param events: dict of signer index string, HistoryData pairs
+    :param known: optional dict of signer index string, event dict pairs that were
+                  already verified.  Their linkage is checked but not their signatures
+    :return: list of (signature, message, verkey) tuples for signing.verify64u or None
+    """
+    known = known or {}
+    checks = []
+    previous = None
+
+    try:
+        for position, index in enumerate(sorted(events, key=signerOrder)):
+            event = events[index]
+            body = event.body
+            signers = body["signers"]
+
+            if index != str(position) or int(body["signer"]) != position:
+                return None  # gap in the chain
+
+            if previous is not None:
+                if body["id"] != previous["id"] or signers[:position + 1] != previous["signers"][:position + 1]:
+                    return None  # does not follow from the previous event
+
+            previous = body
+
+            if known.get(index) == event.data:
+                continue  # already verified
+
+            if position == 0:
+                if event.rotation_sig is not None:
+                    return None
+                checks.append((event.signer_sig, event.bbody, signers[0]))
+            else:
+                if event.rotation_sig is None:
+                    return None
+                checks.append((event.signer_sig, event.bbody, signers[position - 1]))
+                checks.append((event.rotation_sig, event.bbody, signers[position]))
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None  # malformed event
+
+    return checks
+
+
+def verifyChain(events, known=None):
+    """
+    Returns True if events form a correctly linked rotation chain whose signatures
+    are all valid.  Every key is used by two consecutive events so it is only
+    decoded once through signing's verkey cache.  Signatures are verified on the
+    ParallelVerifier in use if one is set.  See chainChecks.
+
+    :param events: dict of signer index string, HistoryData pairs
+    :param known: optional dict of events that were already verified
+    """
+    checks = chainChecks(events, known)
+    verifier = verifying.getVerifier()
+
+    if checks is None:
+        return False
+
+    if verifier is not None:
+        return verifier.verify(checks)
+
+    return all(signing.verify64u(*check) for check in checks)
+
+
+def eventsDigest(events):
+    """
+    Returns a hex digest identifying a dict of rotation events.  It covers the
+    signed body and signatures of every event in signer order, so servers
+    returning the same events get the same digest regardless of formatting or
+    dict order.  See ChainTree.
+
+    :param events: dict of signer index string, HistoryData pairs
+    """
+    return ChainTree(events).root.hex()
+
+
+def quorumSize(total):
+    """
+    Returns the smallest number of matching responses that is a majority of total servers.
+
+    :param total: int, number of servers
+    """
+    return next(size for size in range(total + 1) if size >= total * MAJORITY)
+
+
 class AbstractConsense(ABC):
     def __init__(self):
         self.valid_data = {}
@@ -21,6 +189,7 @@ class AbstractConsense(ABC):
         self.num_valid = 0
         self.results = {}
         self.consensus = None
+        self.received = {}  # raw response bytes: (validation status, hashd, data) of the first server that sent them
 
     def incrementValid(self):
         self.num_valid += 1
@@ -34,9 +203,12 @@ class AbstractConsense(ABC):
     def addError(self, url, response, http_status):
         self.addResult(url, ConsensusResult.ERROR, response, http_status)
 
-    def addFailure(self, url, response, http_status):
+    def addFailure(self, url, response, http_status, raw=None):
         self.addResult(url, ConsensusResult.FAILED, response, http_status)
 
+        if raw is not None:
+            self.received[raw] = (ConsensusResult.FAILED, None, response)
+
     def addMatchCount(self, hashd):
         self.valid_match_counts[hashd] = self.valid_match_counts.get(hashd, 0) + 1
 
@@ -44,21 +216,86 @@ class AbstractConsense(ABC):
         self.incrementValid()
         self.valid_data[hashd] = data
 
-    def addSuccess(self, url, hashd, data, http_status):
+    def addSuccess(self, url, hashd, data, http_status, raw=None):
         self.addResult(url, ConsensusResult.VALID, data, http_status)
         self.addMatchCount(hashd)
         self.addValidData(hashd, data)
 
+        if raw is not None:
+            self.received[raw] = (ConsensusResult.VALID, hashd, data)
+
+    def addRepeat(self, url, response):
+        """
+            Records the same result for response as for an earlier response whose
+            body was byte for byte identical, skipping signature verification and
+            hashing.  Servers normally return identical bytes for the same data.
+
+            :param url: url string that was queried
+            :param response: DideryResponse obj
+            :return: True if response repeated an earlier response
+        """
+        if response.raw is None or response.raw not in self.received:
+            return False
+
+        validation, hashd, data = self.received[response.raw]
+
+        if validation == ConsensusResult.VALID:
+            self.addSuccess(url, hashd, data, response.status)
+        else:
+            self.addFailure(url, data, response.status)
+
+        return True
+
     @abstractmethod
-    def validateData(self, data):
+    def validateResponse(self, url, response):
         pass
 
-    def consense(self, data):
+    def validateData(self, data):
+        """
+            Checks for request errors and counts valid signatures
+
+            :param data: dict of DideryResponse obj
+        """
+        for url, response in data.items():
+            self.validateResponse(url, response)
+
+    def checkConsensus(self, total):
+        """
+            Checks whether a majority of total servers returned matching data.
+
+            :param total: int, number of servers that were queried
+            :return: data that reached consensus or None
+        """
+        for hashData, count in self.valid_match_counts.items():
+            if count >= total * MAJORITY:
+                self.consensus = self.valid_data[hashData]
+
+        return self.consensus
+
+    def decided(self, total):
+        """
+            Returns True once the outcome of consensus can no longer be changed by
+            the servers that have not responded yet.  Either a majority already
+            agrees or no data can reach a majority even if all remaining servers match it.
+
+            :param total: int, number of servers that were queried
+        """
+        if self.checkConsensus(total) is not None:
+            return True
+
+        remaining = total - len(self.results)
+        best = max(self.valid_match_counts.values(), default=0)
+
+        return best + remaining < total * MAJORITY
+
+    def consense(self, data, total=None):
         """
             Validates signatures and then checks
             if a majority of the data items are equal.
 
             :param data: list of history dicts returned by the didery server
+            :param total: int, number of servers queried. Defaults to len(data).
+                          Must be supplied when data only holds some of the responses
             :return: tuple - history dict and dict of result strings for each url.
                      if consensus is not reached then None and the results dict are returned
         """
@@ -66,13 +303,79 @@ class AbstractConsense(ABC):
             raise ValueError("data cannot be None.")
 
         self.validateData(data)
+        self.checkConsensus(len(data) if total is None else total)
 
-        for hashData, count in self.valid_match_counts.items():
-            if count >= len(data) * MAJORITY:
-                self.consensus = self.valid_data[hashData]
+        return self.consensus, self.results
+
+    def consenseAsync(self, generators):
+        """
+            Runs the supplied requests feeding each response into consensus as it
+            arrives.  Returns as soon as the outcome is decided and cancels the
+            requests that are still outstanding.  Servers whose requests were
+            cancelled are not included in the results.
+
+            :param generators: dict of url, request pairs. See helping.awaitAll
+            :return: tuple - data and dict of result strings for each url.
+                     if consensus is not reached then None and the results dict are returned
+        """
+        return transporting.run(self.awaitQuorum(generators))
+
+    async def awaitQuorum(self, generators):
+        """
+            Coroutine version of consenseAsync for callers running on an event loop.
+
+            :param generators: dict of url, request pairs. See helping.awaitAll
+            :return: tuple - data and dict of result strings for each url.
+                     if consensus is not reached then None and the results dict are returned
+        """
+        if not generators:
+            raise ValueError("generators cannot be empty.")
+
+        total = len(generators)
+
+        def until(url, response):
+            self.validateResponse(url, response)
+            return self.decided(total)
+
+        await helping.awaitAll(generators, until=until, idempotent=True)
+        self.checkConsensus(total)
 
         return self.consensus, self.results
 
+    def consenseSelective(self, urls, request):
+        """
+            Queries the fewest servers that can reach a majority, choosing the fastest
+            according to the health monitor, and only escalates to the remaining
+            servers if their responses disagree, fail validation or time out.
+            Requests that take longer than usual for their server are hedged by
+            also querying the next fastest server.  See helping.selectConsensus.
+            Servers still outstanding at the transport's deadline are reported as
+            timed out, and servers that were not queried are not included in the results.
+
+            :param urls: list of url strings to query
+            :param request: callable accepting a url and returning its request. See helping.awaitAll
+            :return: tuple - data and dict of result strings for each url queried.
+                     if consensus is not reached then None and the results dict are returned
+        """
+        return transporting.run(self.awaitSelective(urls, request))
+
+    async def awaitSelective(self, urls, request):
+        """
+            Coroutine version of consenseSelective for callers running on an event loop.
+
+            :param urls: list of url strings to query
+            :param request: callable accepting a url and returning its request. See helping.awaitAll
+            :return: tuple - data and dict of result strings for each url queried.
+                     if consensus is not reached then None and the results dict are returned
+        """
+        if not urls:
+            raise ValueError("urls cannot be empty.")
+
+        monitor = monitoring.getMonitor()
+        ranked = monitor.rank(urls) if monitor is not None else list(urls)
+
+        return await helping.selectConsensus(self, ranked, request, quorumSize(len(urls)))
+
 
 class Consense(AbstractConsense):
     def __init__(self, valid_data=None, match_counts=None, results=None, num_valid=None):
@@ -90,32 +393,38 @@ class Consense(AbstractConsense):
         if num_valid:
             self.num_valid = num_valid
 
-    def validateData(self, data):
+    def validateResponse(self, url, response):
         """
-            Checks for request errors and counts valid signatures
+            Checks a single response for request errors and validates its signature
 
-            :param data: dict of DideryResponse obj
+            :param url: url string that was queried
+            :param response: DideryResponse obj
         """
-        for url, response in data.items():
-            status = response.status
-            data = response.response
-
-            if status == 0:
-                self.addTimeOut(url)  # Request timed out
-                continue
-            elif status != 200:
-                self.addError(url, data, status)  # Error with request
-                continue
-
-            if data.valid:
-                self.addSuccess(url, data.signature, data.data, status)  # Signature validated
-            else:
-                self.addFailure(url, data.data, status)  # Signature validation failed
+        status = response.status
+        data = response.response
+
+        if status == 0:
+            self.addTimeOut(url)  # Request timed out
+        elif status != 200:
+            self.addError(url, data, status)  # Error with request
+        elif self.addRepeat(url, response):
+            pass  # Identical to a response already validated
+        elif data.valid:  # signing's verdicts cache skips signatures already verified
+            self.addSuccess(url, data.signature, data.data, status, response.raw)  # Signature validated
+        else:
+            self.addFailure(url, data.data, status, response.raw)  # Signature validation failed
 
 
 class CompositeConsense(AbstractConsense):
-    def __init__(self):
+    def __init__(self, known=None):
+        """
+            :param known: optional dict of signer index string, event dict pairs of
+                          events that were already verified.  Received events equal
+                          to a known event are trusted without verifying them again
+        """
         AbstractConsense.__init__(self)
+        self.known = known or {}
+        self.trees = {}  # hashd: ChainTree of the valid event chains received
 
     def _dataToDict(self, data):
         temp = {}
@@ -124,31 +433,67 @@ class CompositeConsense(AbstractConsense):
 
         return temp
 
-    def validateData(self, history_events):
+    def validateResponse(self, url, response):
         """
-            Checks for request errors and counts valid signatures
+            Checks a single response for request errors and validates the signatures and
+            pre-rotation linkage of every event in one pass over the chain
 
-            :param history_events: dict of history rotation events returned by the didery server
+            :param url: url string that was queried
+            :param response: DideryResponse obj containing a dict of history rotation events
         """
-        for url, response in history_events.items():
-            status = response.status
-            data = response.response
-
-            if status == 0:
-                self.addTimeOut(url)  # Request timed out
-                continue
-            elif status != 200:
-                self.addError(url, data, status)  # Error with request
-                continue
-
-            valid = True if len(data) > 0 else False
-
-            for index, event in data.items():
-                if not event.valid:
-                    valid = False
-
-            if valid:
-                sha = sha256(str(ODict(data)).encode()).hexdigest()
-                self.addSuccess(url, sha, self._dataToDict(data), status)  # Signature validated
-            else:
-                self.addFailure(url, data, status)  # Signature validation failed
+        status = response.status
+        data = response.response
+
+        if status == 0:
+            self.addTimeOut(url)  # Request timed out
+            return
+        elif status != 200:
+            self.addError(url, data, status)  # Error with request
+            return
+        elif self.addRepeat(url, response):
+            return  # Identical to a response already validated
+
+        valid = len(data) > 0 and verifyChain(data, self.known)
+
+        if valid:
+            tree = ChainTree(data)
+            sha = tree.root.hex()
+            self.trees[sha] = tree
+            self.addSuccess(url, sha, self._dataToDict(data), status, response.raw)  # Signature validated
+        else:
+            self.addFailure(url, data, status, response.raw)  # Signature validation failed
+
+    def checkPrefix(self, total):
+        """
+            Finds the longest chain of events that a majority of total servers agree on
+            when their chains differ, e.g. because some servers lag behind.  Chains are
+            compared with their ChainTrees so finding where two servers diverge only
+            takes O(log n) digest comparisons.
+
+            :param total: int, number of servers that were queried
+            :return: tuple - dict of the agreed events and the signer index of the first
+                     event after them, taken from the longest chain received.  The index
+                     is None if no valid chain goes beyond the agreed events.
+                     If no majority agrees on any event then None and 0 are returned
+        """
+        best, agreed = None, 0
+
+        for sha, tree in self.trees.items():
+            shared = sorted(((tree.agreed(other), self.valid_match_counts[other_sha])
+                             for other_sha, other in self.trees.items()), reverse=True)
+            count = 0
+            for length, matches in shared:
+                count += matches
+                if count >= total * MAJORITY:
+                    if length > agreed:
+                        best, agreed = sha, length
+                    break
+
+        if best is None:
+            return None, 0
+
+        events = self.valid_data[best]
+        agreedEvents = dict((index, events[index]) for index in self.trees[best].indices[:agreed])
+        longest = max(self.trees.values(), key=len)
+
+        return agreedEvents, (int(longest.indices[agreed]) if len(longest) > agreed else None)
@@ -1,6 +1,13 @@
 from ..diderying import ValidationError
 
+import asyncio
+import inspect
+import queue
+import threading
+import time
+
 from collections import OrderedDict as ODict
+from collections import deque
 try:
     import simplejson as json
 except ImportError:
@@ -10,13 +17,15 @@ from ioflo.aid import odict
 from ioflo.aio.http import Patron
 from ioflo.aio import WireLog
 from ioflo.base import Store
-from ioflo.aid import timing
 from ioflo.aid import getConsole
 
 
 from ..models.responding import responseFactory
 from ..lib.didering import validateDid
 from ..lib.generating import key64uToKey
+from . import transporting as t
+from . import monitoring as m
+from . import verifying as v
 
 console = getConsole()
 
@@ -70,9 +79,91 @@ def parseConfigFile(file):
     if not isinstance(data["servers"], list):
         raise ValidationError('"servers" field must be a list')
 
+    if data.get("transport", t.IOFLO) not in t.TRANSPORTS:
+        raise ValidationError('"transport" field must be one of {}'.format(", ".join(t.TRANSPORTS)))
+
+    for field in ["pool", "breaker", "hedge", "concurrency", "verify"]:
+        if not isinstance(data.get(field, {}), dict):
+            raise ValidationError('"{}" field must be a dict'.format(field))
+
+    pool = data.get("pool", {})
+
+    if not isInteger(pool.get("max_per_host", 0), 0):
+        raise ValidationError('"pool" max_per_host must be an integer of at least 0')
+
+    if not isNumber(pool.get("idle_timeout", 0), 0):
+        raise ValidationError('"pool" idle_timeout must be a number of at least 0')
+
+    breaker = data.get("breaker", {})
+    cooldown = breaker.get("cooldown", m.DEFAULT_COOLDOWN)
+
+    if not isInteger(breaker.get("threshold", 0), 0):
+        raise ValidationError('"breaker" threshold must be an integer of at least 0')
+
+    if not isNumber(cooldown, 0):
+        raise ValidationError('"breaker" cooldown must be a number of at least 0')
+
+    if not isNumber(breaker.get("max_cooldown", cooldown), cooldown):
+        raise ValidationError('"breaker" max_cooldown must be a number of at least cooldown')
+
+    hedge = data.get("hedge", {})
+    percentile = hedge.get("percentile", m.DEFAULT_HEDGE_PERCENTILE)
+
+    if percentile is not None and not (isNumber(percentile) and 0 < percentile <= 100):
+        raise ValidationError('"hedge" percentile must be a number above 0 and at most 100 or null')
+
+    if not isNumber(hedge.get("budget", 0), 0):
+        raise ValidationError('"hedge" budget must be a number of at least 0')
+
+    concurrency = data.get("concurrency", {})
+
+    for field in ["total", "per_host"]:
+        value = concurrency.get(field, 1)
+        if value is not None and not isInteger(value, 1):
+            raise ValidationError('"concurrency" {} must be a positive integer or null'.format(field))
+
+    verify = data.get("verify", {})
+
+    if verify.get("executor", v.THREAD) not in v.EXECUTORS:
+        raise ValidationError('"verify" executor must be one of {}'.format(", ".join(v.EXECUTORS)))
+
+    for field, least in [("workers", 1), ("batch", 1), ("threshold", 0)]:
+        value = verify.get(field, least)
+        if field == "workers" and value is None:
+            continue  # one per cpu
+        if not isInteger(value, least):
+            raise ValidationError('"verify" {} must be an integer of at least {}'.format(field, least))
+
+    for field in ["timeout", "deadline"]:
+        value = data.get(field, 1)
+        if not isNumber(value) or value <= 0:
+            raise ValidationError('"{}" field must be a positive number of seconds'.format(field))
+
     return data
 
 
+def isInteger(value, least=None):
+    """
+    Returns True if value is an int, and not a bool, of at least least.
+
+    :param value: parsed json value
+    :param least: optional int, smallest value allowed
+    """
+    return (not isinstance(value, bool) and isinstance(value, int) and
+            (least is None or value >= least))
+
+
+def isNumber(value, least=None):
+    """
+    Returns True if value is an int or float, and not a bool, of at least least.
+
+    :param value: parsed json value
+    :param least: optional float, smallest value allowed
+    """
+    return (not isinstance(value, bool) and isinstance(value, (int, float)) and
+            (least is None or value >= least))
+
+
 def parseDataFile(file, dtype):
     data = {}
 
@@ -117,7 +208,7 @@ def httpRequest(method=u'GET',
                 body=b'',
                 data=None,
                 store=None,
-                timeout=1000.0,
+                timeout=None,
                 buffer=False,):
     """
     Perform Async ReST request to Backend Server
@@ -134,8 +225,11 @@ def httpRequest(method=u'GET',
 
     path can be full url with host port etc  path takes precedence over others
 
+    timeout is measured in seconds on the monotonic clock. It defaults to the
+    value set with transporting.setTimeout()
 
     """
+    timeout = t.getTimeout() if timeout is None else timeout
     store = store if store is not None else Store(stamp=0.0)
     if buffer:
         wlog = WireLog(buffify=buffer, same=True)
@@ -165,48 +259,469 @@ def httpRequest(method=u'GET',
     console.concise("Making Request {0} {1} ...\n".format(method, path))
 
     client.transmit()
-    # assumes store clock is advanced elsewhere
-    timer = timing.StoreTimer(store=store, duration=timeout)
-    while ((client.requests or client.connector.txes or not client.responses)
-           and not timer.expired):
-        try:
-            client.serviceAll()
-        except Exception as ex:
-            console.terse("Error: Servicing client. '{0}'\n".format(ex))
-            raise ex
-        yield b''  # this is eventually yielded by wsgi app while waiting
-        store.advanceStamp(0.125)
-
+    last = time.monotonic()
+    expiration = last + timeout
     response = None  # in case timed out
-    if client.responses:
-        response = client.responses.popleft()
-    client.close()
-    if wlog:
-        wlog.close()
+    try:
+        while ((client.requests or client.connector.txes or not client.responses)
+               and last < expiration):
+            try:
+                client.serviceAll()
+            except Exception as ex:
+                console.terse("Error: Servicing client. '{0}'\n".format(ex))
+                raise ex
+            yield b''  # this is eventually yielded by wsgi app while waiting
+            now = time.monotonic()
+            store.advanceStamp(now - last)  # keep the store clock in step with real time
+            last = now
+
+        if client.responses:
+            response = client.responses.popleft()
+    finally:  # also runs when the generator is closed before completing
+        client.close()
+        if wlog:
+            wlog.close()
 
     # response.get('status')
     # response.get('body').decode('utf-8')
     return response
 
 
-def awaitAsync(generators):
+def request(method=u'GET', path=u'/', headers=None, data=None, body=b''):
+    """
+    Returns an awaitable request for the currently selected transport.
+    An ioflo generator is returned by default and an asyncio coroutine is
+    returned when the "asyncio" transport has been selected with
+    transporting.setTransport().  Either can be passed to awaitAsync.
+
+    :param method: http method string
+    :param path: full url to query
+    :param headers: dict of http headers
+    :param data: dict to be sent as a json body
+    :param body: byte string body, ignored if data is supplied
+    """
+    timeout = t.getTimeout()
+
+    if t.getTransport() == t.ASYNCIO:
+        return t.asyncRequest(method, path=path, headers=headers, data=data, body=body, timeout=timeout)
+
+    return httpRequest(method, path=path, headers=headers, data=data, body=body, timeout=timeout)
+
+
+def _responseHelper(url, result):
+    if not result:
+        return responseFactory(url, 0, None)
+
+    if isinstance(result, tuple):  # (body string, status) pairs
+        body, status = result
+        return responseFactory(url, status, json.loads(body))
+
+    raw, status = bytes(result['body']), result.get('status')  # json parses utf-8 bytes directly
+
+    return responseFactory(url, status, json.loads(raw), raw)
+
+
+async def _monitored(url, generator, flow=None, idempotent=False):
+    """
+    Runs a request recording its outcome with the health monitor.  Idempotent
+    requests to servers whose circuit is open are not sent and return None as if
+    they timed out.  Writes are always sent so no server misses an update.
+    The request waits for a slot from the transport's RequestLimiter before it is sent.
+
+    :param flow: hashable identifying the fan-out the request belongs to. See RequestLimiter
+    :param idempotent: bool, the request is a read that can be skipped
+    """
+    monitor = m.getMonitor()
+
+    if monitor is not None and idempotent and not monitor.allow(url):
+        generator.close()
+        return None
+
+    limiter = t.getLimiter()
+    host = m.serverKey(url)
+
+    if limiter is not None:
+        try:
+            await limiter.acquire(host, flow)
+        except BaseException:  # cancelled before it was sent
+            generator.close()
+            raise
+
+    try:
+        if inspect.isgenerator(generator):
+            generator = t.drive(generator)
+
+        start = time.monotonic()
+        result = await generator
+    finally:
+        if limiter is not None:
+            limiter.release(host)
+
+    if monitor is not None:
+        if not result:
+            status = 0
+        elif isinstance(result, tuple):  # (body string, status) pairs
+            status = result[1]
+        else:
+            status = result.get('status', 0)
+        monitor.record(url, status, time.monotonic() - start)
+
+    return result
+
+
+async def iterateAll(generators, deadline=None, limit=None, idempotent=False):
+    """
+    Asynchronous generator that runs the supplied requests and yields
+    (url, DideryResponse) pairs in the order the requests complete.
+
+    :param generators: dict of url, request pairs. Requests can be ioflo
+                       generators from httpRequest or asyncio coroutines
+                       from transporting.asyncRequest
+    :param deadline: optional float, seconds allowed for all of the requests.
+                     Requests still outstanding when it passes are cancelled
+                     and reported as timed out. Defaults to the value set with
+                     transporting.setDeadline()
+    :param limit: optional int, maximum number of requests in flight at once.
+                  The remaining requests are started as earlier ones complete.
+    :param idempotent: bool, the requests are reads that are skipped while their
+                       server's circuit is open. Writes are always sent
+    """
+    deadline = t.getDeadline() if deadline is None else deadline
+    expiration = None if deadline is None else time.monotonic() + deadline
+    unsent = deque(generators.keys())
+    tasks = {}
+    flow = object()
+
+    def start():
+        while unsent and (limit is None or len(tasks) < limit):
+            url = unsent.popleft()
+            tasks[asyncio.ensure_future(_monitored(url, generators.pop(url), flow, idempotent))] = url
+
+    try:
+        start()
+        while tasks:
+            remaining = None if expiration is None else max(expiration - time.monotonic(), 0.0)
+            done, pending = await asyncio.wait(tasks.keys(),
+                                               timeout=remaining,
+                                               return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:  # deadline passed
+                break
+
+            for task in done:
+                url = tasks.pop(task)
+                yield url, _responseHelper(url, task.result())
+
+            start()
+
+        expired = list(tasks.values()) + list(unsent)
+    finally:
+        for task in tasks.keys():
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks.keys())
+        tasks.clear()
+
+        for url in unsent:  # never started
+            generators.pop(url).close()
+        unsent.clear()
+
+    for url in expired:
+        yield url, _responseHelper(url, None)
+
+
+async def awaitAll(generators, until=None, deadline=None, limit=None, idempotent=False):
+    """
+    Coroutine that concurrently runs all of the supplied requests and
+    collects their responses.
+
+    :param generators: dict of url, request pairs. See iterateAll
+    :param until: optional callable accepting (url, DideryResponse) that is
+                  called as each response arrives. When it returns True the
+                  outstanding requests are cancelled and the responses
+                  collected so far are returned.  Once the deadline has passed
+                  every url still outstanding is passed to it as timed out.
+    :param deadline: optional float, see iterateAll
+    :param limit: optional int, see iterateAll
+    :param idempotent: bool, see iterateAll
+    :return: dict of url, DideryResponse pairs
+    """
+    urls = list(generators.keys())
     values = {}
+    deadline = t.getDeadline() if deadline is None else deadline
+    expiration = None if deadline is None else time.monotonic() + deadline
+    responses = iterateAll(generators, deadline=deadline, limit=limit, idempotent=idempotent)
 
-    while True:
-        remove = []
-        for url, generator in generators.items():
-            try:
-                next(generator)
-            except StopIteration as si:
-                if si.value:
-                    values[url] = responseFactory(url, si.value[1], json.loads(si.value[0]))
-                else:
-                    values[url] = responseFactory(url, 0, None)
+    try:
+        async for url, response in responses:
+            values[url] = response
+
+            if until is not None and until(url, response):
+                if expiration is None or time.monotonic() < expiration:
+                    return values
+                # past the deadline the remaining urls are only being reported as timed out
+    finally:
+        await responses.aclose()
 
-                remove.append(url)
+    return ODict((url, values[url]) for url in urls)
 
-        for val in remove:
-            generators.pop(val)
 
-        if len(generators) == 0:
-            return values
+async def iterateConsensus(groups, limit=None, quorum=False):
+    """
+    Asynchronous generator that runs the requests of many consensus checks
+    concurrently and yields (key, data, results) tuples as each check completes.
+    groups is consumed lazily so only the checks with requests in flight are held
+    in memory.
+
+    :param groups: iterable of (key, consense, generators) tuples where consense is
+                   a fresh Consense obj and generators is a dict of url, request pairs.
+                   See iterateAll
+    :param limit: optional int, maximum number of requests in flight at once.
+                  A group is only started when all of its requests fit, except
+                  when nothing else is in flight.
+    :param quorum: bool, yield a group as soon as the outcome of its consensus is
+                   decided and cancel its outstanding requests. Cancelled urls are
+                   not included in the results.
+    """
+    groups = iter(groups)
+    tasks = {}  # task: (group state, url)
+    cancelled = set()
+    waiting = None
+    flow = object()
+
+    def start():
+        nonlocal waiting
+
+        while True:
+            if waiting is None:
+                waiting = next(groups, None)
+                if waiting is None:  # exhausted
+                    return
+
+            key, consense, generators = waiting
+            if tasks and limit is not None and len(tasks) + len(generators) > limit:
+                return
+
+            waiting = None
+            state = [key, consense, len(generators), len(generators)]  # key, consense, total, outstanding
+            for url, generator in generators.items():
+                tasks[asyncio.ensure_future(_monitored(url, generator, flow, True))] = (state, url)
+
+    try:
+        start()
+        while tasks:
+            done, pending = await asyncio.wait(tasks.keys(), return_when=asyncio.FIRST_COMPLETED)
+            cancelled = set(task for task in cancelled if not task.done())
+
+            for task in done:
+                if task not in tasks:  # cancelled after its group was decided
+                    continue
+
+                state, url = tasks.pop(task)
+                key, consense, total, outstanding = state
+                consense.validateResponse(url, _responseHelper(url, task.result()))
+                state[3] = outstanding = outstanding - 1
+
+                if outstanding and not (quorum and consense.decided(total)):
+                    continue
+
+                for other in [other for other, (s, u) in tasks.items() if s is state]:
+                    del tasks[other]
+                    other.cancel()
+                    cancelled.add(other)
+
+                consense.checkConsensus(total)
+                yield key, consense.consensus, consense.results
+
+            start()
+    finally:
+        for task in tasks.keys():
+            task.cancel()
+        cancelled.update(tasks.keys())
+        if cancelled:
+            await asyncio.wait(cancelled)
+        tasks.clear()
+
+        if waiting is not None:  # never started
+            for generator in waiting[2].values():
+                generator.close()
+
+
+async def selectConsensus(consense, urls, request, needed, deadline=None):
+    """
+    Coroutine that checks consensus while sending as few requests as possible.
+    Servers are queried in the order given, starting with just enough to reach
+    needed matching responses.  Another server is added whenever a response
+    fails or disagrees so that a majority is still possible, and when a request
+    has not been answered within the health monitor's hedge delay for its server
+    it is hedged by sending the request to one more server, within the hedge budget.
+    Returns once the outcome of consensus is decided, cancelling outstanding requests.
+
+    :param consense: Consense obj
+    :param urls: list of url strings ordered from the most to the least preferred server
+    :param request: callable accepting a url and returning its request. See iterateAll
+    :param needed: int, matching responses that make up a majority
+    :param deadline: optional float, seconds allowed for all of the requests. Requests
+                     still outstanding when it passes are cancelled and reported as
+                     timed out. Defaults to the value set with transporting.setDeadline()
+    """
+    deadline = t.getDeadline() if deadline is None else deadline
+    expiration = None if deadline is None else time.monotonic() + deadline
+    expired = []
+    total = len(urls)
+    monitor = m.getMonitor()
+    unsent = deque(urls)
+    tasks = {}  # task: (url, time started)
+    hedged = set()
+    flow = object()
+
+    def launch():
+        url = unsent.popleft()
+        tasks[asyncio.ensure_future(_monitored(url, request(url), flow, True))] = (url, time.monotonic())
+
+    def hedges():
+        """ Returns (task, time it should be hedged) pairs for the requests that can still be hedged """
+        if monitor is None or not unsent:
+            return []
+
+        pending = []
+        for task, (url, started) in tasks.items():
+            delay = None if task in hedged else monitor.hedgeDelay(url)
+            if delay is not None:
+                pending.append((task, started + delay))
+
+        return pending
+
+    try:
+        while True:
+            best = max(consense.valid_match_counts.values(), default=0)
+            while unsent and best + len(tasks) < needed:
+                launch()
+
+            if not tasks:
+                break
+
+            now = time.monotonic()
+            pending = hedges()
+            wakes = [when for task, when in pending] + ([] if expiration is None else [expiration])
+            timeout = max(min(wakes) - now, 0.0) if wakes else None
+
+            done, waiting = await asyncio.wait(tasks.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            if not done:  # the deadline or a hedge delay passed
+                now = time.monotonic()
+                if expiration is not None and now >= expiration:
+                    expired = [url for url, started in tasks.values()]
+                    break
+
+                for task, when in pending:
+                    if when <= now:
+                        hedged.add(task)
+                        if unsent and monitor.spendHedge():
+                            launch()
+                continue
+
+            for task in done:
+                url, started = tasks.pop(task)
+                hedged.discard(task)
+                consense.validateResponse(url, _responseHelper(url, task.result()))
+
+            if consense.decided(total):
+                break
+    finally:
+        for task in tasks.keys():
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks.keys())
+        tasks.clear()
+
+    for url in expired:
+        consense.validateResponse(url, _responseHelper(url, None))
+
+    consense.checkConsensus(total)
+
+    return consense.consensus, consense.results
+
+
+def iterateSync(responses, buffer=1):
+    """
+    Generator that runs an asynchronous generator such as iterateConsensus on
+    an event loop in a background thread and yields its values one at a time.
+    The loop keeps running while the caller handles a value so requests in
+    flight are answered, and release their RequestLimiter slots, on time however
+    slow the caller is.  Once buffer values are waiting for the caller the
+    asynchronous generator is not resumed, so no new requests are started.
+    Closing the generator cancels the outstanding requests.
+
+    :param responses: asynchronous generator
+    :param buffer: int, values read ahead of the caller
+    """
+    if buffer < 1:
+        raise ValueError("buffer must be at least 1")
+
+    items = queue.Queue()
+    started = threading.Event()
+    state = {}
+
+    async def pump():
+        space = state["space"] = asyncio.Semaphore(buffer)
+        started.set()
+
+        try:
+            async for value in responses:
+                await space.acquire()
+                items.put((True, value))
+        finally:
+            await responses.aclose()
+
+    def produce():
+        loop = state["loop"] = t.getLoop()
+        state["task"] = task = loop.create_task(pump())
+
+        try:
+            loop.run_until_complete(task)
+            items.put((False, None))
+        except BaseException as ex:
+            items.put((False, ex))
+        finally:
+            started.set()
+            t.getPool().close()  # the thread's loop and connections are not reused
+            loop.close()
+
+    def signal(callback):
+        try:
+            state["loop"].call_soon_threadsafe(callback)
+        except RuntimeError:  # the loop already finished
+            pass
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    started.wait()
+
+    try:
+        while True:
+            more, value = items.get()
+            if not more:
+                if value is not None:
+                    raise value
+                return
+
+            yield value
+            signal(lambda: state["space"].release())
+    finally:
+        signal(lambda: state["task"].cancel())
+        thread.join()
+
+
+def awaitAsync(generators, until=None, deadline=None, limit=None, idempotent=False):
+    """
+    Runs all of the supplied requests to completion on the event loop and
+    returns a dict of url, DideryResponse pairs.
+
+    :param generators: dict of url, request pairs. See iterateAll
+    :param until: optional callable, see awaitAll
+    :param deadline: optional float, see iterateAll
+    :param limit: optional int, see iterateAll
+    :param idempotent: bool, see iterateAll
+    """
+    return t.run(awaitAll(generators, until=until, deadline=deadline, limit=limit, idempotent=idempotent))
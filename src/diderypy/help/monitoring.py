@@ -0,0 +1,323 @@
+"""
+Health tracking and circuit breaking for didery servers.
+
+Every request made through helping.iterateAll or helping.iterateConsensus is
+recorded against its server.  When a circuit breaker is configured, after
+threshold consecutive failures the server's circuit opens and reads from it
+are skipped, reported as timed out, for a cool down period.  Writes are always
+sent so a recovered server does not miss updates.  Once the cool down has
+passed the server is probed in a background thread and only used again after
+it answers.  Skipped servers still count towards the number of servers
+consensus is computed against so a majority still requires agreement from 2/3
+of the configured servers.  The default monitor only tracks health and never
+opens a circuit.
+
+The latency of every server is also tracked so selective reads can rank
+servers from fastest to slowest and hedge requests that take longer than usual.
+"""
+import math
+import threading
+import time
+
+from collections import deque
+from urllib.parse import urlsplit
+
+from . import transporting as t
+
+
+DEFAULT_THRESHOLD = 3  # consecutive failures that open a server's circuit
+DEFAULT_COOLDOWN = 30.0  # seconds a circuit stays open before the server is probed
+DEFAULT_MAX_COOLDOWN = 300.0  # cool down doubles after each failed probe up to this
+DEFAULT_ALPHA = 0.2  # weight of the latest request in the moving error rate and latency
+DEFAULT_HEDGE_PERCENTILE = 95.0  # percentile of a server's latencies after which a request is hedged
+DEFAULT_HEDGE_BUDGET = 0.1  # hedged requests allowed as a fraction of all requests
+HEDGE_SAMPLES = 100  # recent latencies kept per server
+HEDGE_MIN_SAMPLES = 5  # latencies needed before a server's requests are hedged
+
+CLOSED = "closed"
+OPEN = "open"
+PROBING = "probing"
+
+_monitor = None
+
+
+def serverKey(url):
+    """
+    Returns the scheme://host:port part of url that identifies its server.
+    """
+    splits = urlsplit(url)
+    return "{0}://{1}".format(splits.scheme, splits.netloc)
+
+
+def failed(status):
+    """
+    Returns True if a response status means the server could not serve the request.
+    0 is a timeout or connection failure.
+    """
+    return status == 0 or status >= 500
+
+
+class ServerHealth:
+    """
+    ServerHealth holds the request history of a single server.
+    """
+    def __init__(self, cooldown):
+        self.successes = 0
+        self.failures = 0
+        self.consecutiveFailures = 0
+        self.errorRate = 0.0  # exponentially weighted moving average of failures
+        self.latency = None  # exponentially weighted moving average of response seconds
+        self.latencies = deque(maxlen=HEDGE_SAMPLES)  # recent seconds of successful responses
+        self.lastSuccess = None  # unix time
+        self.lastFailure = None  # unix time
+        self.state = CLOSED
+        self.openedAt = None  # monotonic time
+        self.cooldown = cooldown
+
+    def __repr__(self):
+        return "ServerHealth(state={0}, successes={1}, failures={2}, errorRate={3:.2f}, latency={4})".format(
+            self.state, self.successes, self.failures, self.errorRate, self.latency)
+
+
+class HealthMonitor:
+    """
+    HealthMonitor tracks the health of every server requests are made to and
+    decides which servers are skipped because their circuit is open.
+    """
+    def __init__(self,
+                 threshold=DEFAULT_THRESHOLD,
+                 cooldown=DEFAULT_COOLDOWN,
+                 maxCooldown=DEFAULT_MAX_COOLDOWN,
+                 alpha=DEFAULT_ALPHA,
+                 hedgePercentile=DEFAULT_HEDGE_PERCENTILE,
+                 hedgeBudget=DEFAULT_HEDGE_BUDGET):
+        """
+        Initialize a HealthMonitor object
+
+        :param threshold: int, consecutive failures that open a server's circuit. 0 never opens it
+        :param cooldown: float, seconds a circuit stays open before the server is probed
+        :param maxCooldown: float, longest cool down after repeated failed probes
+        :param alpha: float, 0-1 weight of the latest request in the moving error rate and latency
+        :param hedgePercentile: float, 0-100 percentile of a server's recent latencies after which
+                                a selective read sends the request to an extra server. None disables hedging
+        :param hedgeBudget: float, hedged requests allowed as a fraction of all requests recorded
+        """
+        if threshold < 0:
+            raise ValueError("threshold cannot be negative")
+
+        if cooldown < 0 or maxCooldown < cooldown:
+            raise ValueError("cooldown must be positive and no greater than maxCooldown")
+
+        if not 0.0 < alpha <= 1.0:
+            raise ValueError("alpha must be between 0 and 1")
+
+        if hedgePercentile is not None and not 0.0 < hedgePercentile <= 100.0:
+            raise ValueError("hedgePercentile must be between 0 and 100")
+
+        if hedgeBudget < 0:
+            raise ValueError("hedgeBudget cannot be negative")
+
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.maxCooldown = maxCooldown
+        self.alpha = alpha
+        self.hedgePercentile = hedgePercentile
+        self.hedgeBudget = hedgeBudget
+        self.requests = 0
+        self.hedges = 0
+        self.servers = {}
+        self._lock = threading.Lock()
+
+    def health(self, url):
+        """
+        Returns the ServerHealth of the server url belongs to.
+        """
+        key = serverKey(url)
+
+        with self._lock:
+            health = self.servers.get(key)
+            if health is None:
+                health = self.servers[key] = ServerHealth(self.cooldown)
+
+            return health
+
+    def allow(self, url):
+        """
+        Returns True if a request to url should be sent.  Requests are refused
+        while the server's circuit is open.  When its cool down has passed a
+        background probe of the server is started.
+        """
+        health = self.health(url)
+
+        with self._lock:
+            if health.state == CLOSED:
+                return True
+
+            if health.state == OPEN and time.monotonic() - health.openedAt >= health.cooldown:
+                health.state = PROBING
+                threading.Thread(target=self._probe, args=(serverKey(url),), daemon=True).start()
+
+            return False
+
+    def record(self, url, status, elapsed=None):
+        """
+        Records the outcome of a request to url.
+
+        :param url: url that was requested
+        :param status: int, http status of the response or 0 for a timeout or connection failure
+        :param elapsed: optional float, seconds the request took
+        """
+        health = self.health(url)
+        failure = failed(status)
+
+        with self._lock:
+            self.requests += 1
+            health.errorRate += self.alpha * (float(failure) - health.errorRate)
+
+            if elapsed is not None:
+                if health.latency is None:
+                    health.latency = elapsed
+                else:
+                    health.latency += self.alpha * (elapsed - health.latency)
+
+                if not failure:
+                    health.latencies.append(elapsed)
+
+            if failure:
+                health.failures += 1
+                health.consecutiveFailures += 1
+                health.lastFailure = time.time()
+
+                if health.state == CLOSED and self.threshold and health.consecutiveFailures >= self.threshold:
+                    health.state = OPEN
+                    health.openedAt = time.monotonic()
+            else:
+                health.successes += 1
+                health.consecutiveFailures = 0
+                health.lastSuccess = time.time()
+                health.state = CLOSED
+                health.cooldown = self.cooldown
+
+    def rank(self, urls):
+        """
+        Returns urls ordered from the server expected to answer first to the last.
+        Servers are ordered by their moving average latency.  Servers that have not
+        been measured yet come first so they are measured, and servers whose circuit
+        is open come last.  Ties keep the order of urls.
+
+        :param urls: list of url strings
+        """
+        def expected(url):
+            health = self.health(url)
+            return (health.state != CLOSED, health.latency or 0.0)
+
+        return sorted(urls, key=expected)
+
+    def hedgeDelay(self, url):
+        """
+        Returns the seconds after which a request to url that has not been answered
+        should be hedged, the hedgePercentile of the server's recent latencies, or
+        None if hedging is disabled or too few latencies have been recorded.
+        """
+        if self.hedgePercentile is None:
+            return None
+
+        health = self.health(url)
+
+        with self._lock:
+            if len(health.latencies) < HEDGE_MIN_SAMPLES:
+                return None
+
+            latencies = sorted(health.latencies)
+
+        index = max(int(math.ceil(self.hedgePercentile / 100.0 * len(latencies))) - 1, 0)
+
+        return latencies[index]
+
+    def spendHedge(self):
+        """
+        Returns True and counts a hedged request if the hedge budget allows one more.
+        """
+        with self._lock:
+            if self.hedges + 1 > self.hedgeBudget * self.requests:
+                return False
+
+            self.hedges += 1
+
+            return True
+
+    def probe(self, url):
+        """
+        Sends a single request to the server url belongs to and closes its circuit
+        if the server answers.  Otherwise the circuit is reopened with a doubled cool down.
+
+        :return: bool, True if the server answered
+        """
+        key = serverKey(url)
+        response = t.run(t.asyncRequest(method="HEAD", path=key + "/history"))
+        alive = response is not None and not failed(response["status"])
+        health = self.health(key)
+
+        with self._lock:
+            if alive:
+                health.successes += 1
+                health.consecutiveFailures = 0
+                health.lastSuccess = time.time()
+                health.state = CLOSED
+                health.cooldown = self.cooldown
+            else:
+                health.failures += 1
+                health.lastFailure = time.time()
+                health.state = OPEN
+                health.openedAt = time.monotonic()
+                health.cooldown = min(health.cooldown * 2, self.maxCooldown)
+
+        return alive
+
+    def _probe(self, key):
+        try:
+            self.probe(key)
+        finally:  # the probe thread's loop and connections are not reused
+            t.getPool().close()
+            t.getLoop().close()
+
+
+def setMonitor(monitor):
+    """
+    Sets the HealthMonitor used for all following requests.
+
+    :param monitor: HealthMonitor or None to send every request without tracking health
+    """
+    global _monitor
+
+    _monitor = monitor
+
+
+def getMonitor():
+    """
+    Returns the HealthMonitor in use or None if health tracking is disabled.
+    """
+    return _monitor
+
+
+def configure(config):
+    """
+    Applies the breaker and hedge settings found in a parsed config file.
+    Without a "breaker" field no server is ever skipped.
+
+    :param config: dict as returned by helping.parseConfigFile
+    """
+    breaker = config.get("breaker")
+    hedge = config.get("hedge", {})
+    threshold = 0 if breaker is None else breaker.get("threshold", DEFAULT_THRESHOLD)
+    breaker = breaker or {}
+    cooldown = breaker.get("cooldown", DEFAULT_COOLDOWN)
+
+    setMonitor(HealthMonitor(threshold=threshold,
+                             cooldown=cooldown,
+                             maxCooldown=breaker.get("max_cooldown", max(cooldown, DEFAULT_MAX_COOLDOWN)),
+                             hedgePercentile=hedge.get("percentile", DEFAULT_HEDGE_PERCENTILE),
+                             hedgeBudget=hedge.get("budget", DEFAULT_HEDGE_BUDGET)))
+
+
+setMonitor(HealthMonitor(threshold=0))  # tracks latency for selective reads, the breaker is off
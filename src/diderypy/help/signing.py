@@ -1,22 +1,114 @@
+import ctypes
+import threading
 import libnacl
 
+from collections import OrderedDict as ODict
+from hashlib import blake2b
+
 from ..lib import generating as gen
 
 
+VERKEY_CACHE_SIZE = 4096
+VERDICT_CACHE_SIZE = 65536
+
+
+class LRUCache:
+    """
+    LRUCache is a thread safe mapping that holds at most maxsize items and
+    discards the least recently used item when it is full.  It counts hits and
+    misses so that its effectiveness can be monitored.
+    """
+    def __init__(self, maxsize):
+        """
+        Initialize a LRUCache object
+
+        :param maxsize: int, maximum number of items held. 0 disables the cache
+        """
+        if maxsize < 0:
+            raise ValueError("maxsize cannot be negative")
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = ODict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._items.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            if self.maxsize == 0:
+                return
+
+            self._items[key] = value
+            self._items.move_to_end(key)
+
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+verkeys = LRUCache(VERKEY_CACHE_SIZE)  # base64 verkey: decoded verkey
+verdicts = LRUCache(VERDICT_CACHE_SIZE)  # digest of (signature, message, verkey): verify result
+
+
+def _buffer(data):
+    """
+    Returns an object libnacl can pass to libsodium for data without copying it
+    when possible.  bytes are passed through, writable buffers such as bytearray
+    are wrapped in a ctypes array sharing their memory, and read only memoryviews
+    over a whole bytes object are unwrapped.  Anything else is copied.
+
+    :param data: bytes-like object
+    """
+    if isinstance(data, bytes):
+        return data
+
+    view = memoryview(data)
+    if not view.c_contiguous:
+        return view.tobytes()
+
+    if not view.readonly:
+        return (ctypes.c_char * view.nbytes).from_buffer(view)
+
+    if isinstance(view.obj, bytes) and view.nbytes == len(view.obj):
+        return view.obj
+
+    return view.tobytes()
+
+
 def signResource(resource, sKey):
     """
     signResource accepts a byte string and an EdDSA (Ed25519) key in the form of a byte string
     and returns a base64 url-file safe signature.
 
-    :param resource: byte string to be signed
+    :param resource: bytes-like object to be signed
     :param sKey: signing/private key from EdDSA (Ed25519) key
     :return: url-file safe base64 signature string
     """
     if resource is None:
         return None
 
-    sig = libnacl.crypto_sign(resource, sKey)
-    sig = sig[:libnacl.crypto_sign_BYTES]
+    sig = libnacl.crypto_sign_detached(_buffer(resource), sKey)
 
     return gen.keyToKey64u(sig)
 
@@ -25,13 +117,44 @@ def verify(sig, msg, vk):
     """
     Returns True if signature sig of message msg is verified with
     verification key vk Otherwise False
-    All of sig, msg, vk are bytes
+    All of sig, msg, vk are bytes. msg can also be any other bytes-like
+    object such as a memoryview and is verified without being copied.
     """
     try:
-        result = libnacl.crypto_sign_open(sig + msg, vk)
+        libnacl.crypto_sign_verify_detached(sig, _buffer(msg), vk)
     except Exception as ex:
         return False
-    return True if result else False
+    return True
+
+
+def key64uToVerkey(verkey):
+    """
+    Returns the decoded bytes of a base64 url-file safe verification key.
+    Decoded keys are kept in the verkeys cache.
+
+    :param verkey: base64 url-file safe verifier/public key string
+    """
+    vk = verkeys.get(verkey)
+
+    if vk is None:
+        vk = gen.key64uToKey(verkey)
+        verkeys.put(verkey, vk)
+
+    return vk
+
+
+def verdictKey(signature, message, verkey):
+    """
+    Returns the key of the verdicts cache entry for signature, message and verkey.
+    """
+    digest = blake2b(digest_size=32)
+    digest.update(signature.encode())
+    digest.update(b"\x00")
+    digest.update(verkey.encode())
+    digest.update(b"\x00")
+    digest.update(message)
+
+    return digest.digest()
 
 
 def verify64u(signature, message, verkey):
@@ -42,8 +165,21 @@ def verify64u(signature, message, verkey):
     signature and verkey are encoded as unicode base64 url-file strings
     and message is unicode string as would be the case for a json object
 
+    Results are kept in the verdicts cache keyed by a digest of signature,
+    message and verkey so verifying the same data again does not repeat
+    the Ed25519 verification.
     """
-    sig = gen.key64uToKey(signature)
-    vk = gen.key64uToKey(verkey)
+    if signature is None or verkey is None:
+        return False
+
+    key = verdictKey(signature, message, verkey)
+    verdict = verdicts.get(key)
+
+    if verdict is None:
+        sig = gen.key64uToKey(signature)
+        vk = key64uToVerkey(verkey)
+
+        verdict = verify(sig, message, vk)
+        verdicts.put(key, verdict)
 
-    return verify(sig, message, vk)
+    return verdict
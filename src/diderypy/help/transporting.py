@@ -0,0 +1,689 @@
+"""
+Asyncio based http transport for communicating with didery servers.
+
+The ioflo Patron transport in helping.httpRequest is polled by repeatedly calling
+next() on a generator.  The coroutines in this module instead await socket
+readiness on an asyncio event loop so many requests can be in flight at once
+without spinning the cpu while waiting on slow servers.
+"""
+import asyncio
+import ssl
+import threading
+import time
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from collections import deque
+from collections import OrderedDict as ODict
+from urllib.parse import urlsplit, urlencode, quote
+
+from ioflo.aid import odict
+from ioflo.aid import getConsole
+
+console = getConsole()
+
+
+IOFLO = "ioflo"
+ASYNCIO = "asyncio"
+TRANSPORTS = (IOFLO, ASYNCIO)
+IDEMPOTENT = (u"GET", u"HEAD")  # methods retried when a reused connection was closed
+
+DEFAULT_TIMEOUT = 10.0  # seconds allowed for each request
+DEFAULT_DEADLINE = None  # seconds allowed for a whole fan-out, None for no limit
+DEFAULT_MAX_PER_HOST = 8  # idle connections kept per server
+DEFAULT_IDLE_TIMEOUT = 30.0  # seconds before an idle connection is closed
+DEFAULT_CONCURRENCY = 128  # requests in flight at once across the process
+DEFAULT_HOST_CONCURRENCY = 16  # requests in flight at once to a single server
+
+_transport = IOFLO
+_timeout = DEFAULT_TIMEOUT
+_deadline = DEFAULT_DEADLINE
+_poolLimits = (DEFAULT_MAX_PER_HOST, DEFAULT_IDLE_TIMEOUT)
+_limiter = None
+_local = threading.local()
+_worker = None  # event loop of the thread running requests for threads already running a loop
+_workerLock = threading.Lock()
+
+
+def setTransport(transport):
+    """
+    Select the transport used by helping.request for all following requests.
+
+    :param transport: string, either "ioflo" or "asyncio"
+    """
+    global _transport
+
+    if transport not in TRANSPORTS:
+        raise ValueError("transport must be one of {}".format(", ".join(TRANSPORTS)))
+
+    _transport = transport
+
+
+def getTransport():
+    """
+    Returns the name of the currently selected transport.
+    """
+    return _transport
+
+
+def setTimeout(timeout):
+    """
+    Sets the wall clock time allowed for each request before it is reported as timed out.
+
+    :param timeout: float, seconds
+    """
+    global _timeout
+
+    if timeout is None or timeout <= 0:
+        raise ValueError("timeout must be a positive number of seconds")
+
+    _timeout = timeout
+
+
+def getTimeout():
+    """
+    Returns the number of seconds allowed for each request.
+    """
+    return _timeout
+
+
+def setDeadline(deadline):
+    """
+    Sets the wall clock time allowed for all of the requests sent to the servers
+    by a single call.  Requests still outstanding when the deadline passes are
+    cancelled and reported as timed out.
+
+    :param deadline: float, seconds or None for no limit
+    """
+    global _deadline
+
+    if deadline is not None and deadline <= 0:
+        raise ValueError("deadline must be a positive number of seconds or None")
+
+    _deadline = deadline
+
+
+def getDeadline():
+    """
+    Returns the number of seconds allowed for a whole fan-out or None if there is no limit.
+    """
+    return _deadline
+
+
+def configure(config):
+    """
+    Applies the transport settings found in a parsed config file.
+
+    :param config: dict as returned by helping.parseConfigFile
+    """
+    setTransport(config.get("transport", IOFLO))
+    setTimeout(config.get("timeout", DEFAULT_TIMEOUT))
+    setDeadline(config.get("deadline", DEFAULT_DEADLINE))
+
+    pool = config.get("pool", {})
+    setPoolLimits(maxPerHost=pool.get("max_per_host", DEFAULT_MAX_PER_HOST),
+                  idleTimeout=pool.get("idle_timeout", DEFAULT_IDLE_TIMEOUT))
+
+    concurrency = config.get("concurrency", {})
+    setLimiter(RequestLimiter(total=concurrency.get("total", DEFAULT_CONCURRENCY),
+                              perHost=concurrency.get("per_host", DEFAULT_HOST_CONCURRENCY)))
+
+
+def getLoop():
+    """
+    Returns the asyncio event loop used by this thread for didery requests.
+    The loop is created on first use and reused afterwards.
+    """
+    loop = getattr(_local, "loop", None)
+
+    if loop is None or loop.is_closed():
+        loop = asyncio.new_event_loop()
+        _local.loop = loop
+
+    return loop
+
+
+def runningLoop():
+    """
+    Returns the event loop running in this thread or None if there is none.
+    """
+    return asyncio.events._get_running_loop()  # asyncio.get_running_loop needs python 3.7
+
+
+def getWorkerLoop():
+    """
+    Returns the event loop of the background thread that runs requests for threads
+    already running an event loop of their own.  The thread is started on first use.
+    """
+    global _worker
+
+    with _workerLock:
+        if _worker is None:
+            _worker = asyncio.new_event_loop()
+            threading.Thread(target=_serve, args=(_worker,), name="didery", daemon=True).start()
+
+        return _worker
+
+
+def _serve(loop):
+    _local.loop = loop
+    loop.run_forever()
+
+
+def setPoolLimits(maxPerHost=DEFAULT_MAX_PER_HOST, idleTimeout=DEFAULT_IDLE_TIMEOUT):
+    """
+    Sets the limits of the ConnectionPool each thread uses for its event loop.
+    Every thread replaces its pool with one using the new limits the next time
+    it sends a request.  See ConnectionPool.
+
+    :param maxPerHost: int, maximum number of idle connections kept per server. 0 disables reuse
+    :param idleTimeout: float, seconds an idle connection is kept before it is closed
+    """
+    global _poolLimits
+
+    if maxPerHost < 0:
+        raise ValueError("maxPerHost cannot be negative")
+
+    if idleTimeout < 0:
+        raise ValueError("idleTimeout cannot be negative")
+
+    _poolLimits = (maxPerHost, idleTimeout)
+
+
+def getPoolLimits():
+    """
+    Returns the (maxPerHost, idleTimeout) limits of the ConnectionPool each thread uses.
+    """
+    return _poolLimits
+
+
+def getPool():
+    """
+    Returns the ConnectionPool used by the event loop running in this thread, or by
+    this thread's own loop when none is running.  Connections belong to the loop
+    they were opened on so the pool is replaced when the thread runs another loop.
+    It is created with the limits set with setPoolLimits, and replaced when they change.
+    """
+    limits, loop, pool = getattr(_local, "pool", (None, None, None))
+
+    if pool is None or limits != _poolLimits or loop is not (runningLoop() or getLoop()):
+        pool = ConnectionPool(*_poolLimits)
+        setPool(pool)
+
+    return pool
+
+
+def setPool(pool):
+    """
+    Replaces the ConnectionPool of the event loop running in this thread, or of this
+    thread's own loop, closing any idle connections held by the old one.  It is used
+    until the limits set with setPoolLimits change.
+
+    :param pool: ConnectionPool
+    """
+    limits, loop, old = getattr(_local, "pool", (None, None, None))
+    if old is not None:
+        old.close()
+
+    _local.pool = (_poolLimits, runningLoop() or getLoop(), pool)
+
+
+def setLimiter(limiter):
+    """
+    Sets the RequestLimiter shared by every thread for all following requests.
+
+    :param limiter: RequestLimiter or None to send requests without limiting concurrency
+    """
+    global _limiter
+
+    _limiter = limiter
+
+
+def getLimiter():
+    """
+    Returns the RequestLimiter in use or None if concurrency is not limited.
+    """
+    return _limiter
+
+
+def run(coroutine):
+    """
+    Runs coroutine to completion on this thread's event loop and returns its result.
+    A thread that is already running an event loop, e.g. a coroutine calling
+    historying.getHistory, cannot run another one so the coroutine is run on the
+    worker loop instead and the thread blocks until it completes.  Coroutines should
+    await the coroutine versions such as historying.awaitHistory instead.
+    """
+    if runningLoop() is None:
+        return getLoop().run_until_complete(coroutine)
+
+    return asyncio.run_coroutine_threadsafe(coroutine, getWorkerLoop()).result()
+
+
+async def drive(generator):
+    """
+    Wraps an ioflo request generator in a coroutine so that it can be
+    scheduled on the event loop alongside asyncio requests.
+
+    :param generator: generator as returned by helping.httpRequest
+    :return: the generators return value
+    """
+    try:
+        while True:
+            try:
+                next(generator)
+            except StopIteration as si:
+                return si.value
+
+            await asyncio.sleep(0)
+    finally:  # closes the underlying connection if the request was cancelled
+        generator.close()
+
+
+class ConnectionPool:
+    """
+    ConnectionPool keeps keep-alive connections to didery servers open between
+    requests so that repeated requests to the same server do not pay for tcp and
+    tls setup each time.  Connections are keyed by (scheme, host, port).
+    """
+    def __init__(self, maxPerHost=DEFAULT_MAX_PER_HOST, idleTimeout=DEFAULT_IDLE_TIMEOUT):
+        """
+        Initialize a ConnectionPool object
+
+        :param maxPerHost: int, maximum number of idle connections kept per server.
+                           0 disables connection reuse.
+        :param idleTimeout: float, seconds an idle connection is kept before it is closed
+        """
+        if maxPerHost < 0:
+            raise ValueError("maxPerHost cannot be negative")
+
+        if idleTimeout < 0:
+            raise ValueError("idleTimeout cannot be negative")
+
+        self.maxPerHost = maxPerHost
+        self.idleTimeout = idleTimeout
+        self.connections = {}
+        self._context = None
+
+    @property
+    def context(self):
+        if self._context is None:
+            self._context = ssl.create_default_context()
+
+        return self._context
+
+    @property
+    def size(self):
+        return sum(len(idle) for idle in self.connections.values())
+
+    async def acquire(self, scheme, host, port):
+        """
+        Returns an idle connection to the server if there is one otherwise opens a new one.
+
+        :return: (reader, writer, reused) tuple
+        """
+        self.evict()
+
+        idle = self.connections.get((scheme, host, port))
+        while idle:
+            reader, writer, stamp = idle.pop()
+            if reader.at_eof() or writer.transport.is_closing():  # StreamWriter.is_closing needs python 3.7
+                writer.close()
+                continue
+
+            return reader, writer, True
+
+        context = self.context if scheme == u"https" else None
+        reader, writer = await asyncio.open_connection(host, port, ssl=context)
+
+        return reader, writer, False
+
+    def release(self, scheme, host, port, reader, writer):
+        """
+        Returns a connection to the pool after a complete response has been read from it.
+        """
+        idle = self.connections.setdefault((scheme, host, port), deque())
+
+        if len(idle) >= self.maxPerHost or reader.at_eof() or writer.transport.is_closing():
+            writer.close()
+            return
+
+        idle.append((reader, writer, time.monotonic()))
+
+    def evict(self):
+        """
+        Closes connections that have been idle for longer than idleTimeout.
+        """
+        expired = time.monotonic() - self.idleTimeout
+
+        for key in list(self.connections.keys()):
+            idle = self.connections[key]
+            while idle and idle[0][2] < expired:
+                idle.popleft()[1].close()
+
+            if not idle:
+                del self.connections[key]
+
+    def close(self):
+        """
+        Closes all idle connections.
+        """
+        for idle in self.connections.values():
+            for reader, writer, stamp in idle:
+                try:
+                    writer.close()
+                except RuntimeError:  # the loop the connection was opened on is closed
+                    pass
+
+        self.connections = {}
+
+
+class RequestLimiter:
+    """
+    RequestLimiter bounds the number of requests in flight at once, both in total
+    and to each server, so large fan-outs do not exhaust sockets or file descriptors.
+    It is shared by every thread and event loop in the process.
+
+    Requests that have to wait are queued by flow, typically one flow per fan-out,
+    and freed slots are handed to the flows in turn so a large batch cannot starve
+    a small request that was queued after it.
+    """
+    def __init__(self, total=DEFAULT_CONCURRENCY, perHost=DEFAULT_HOST_CONCURRENCY):
+        """
+        Initialize a RequestLimiter object
+
+        :param total: int, maximum requests in flight at once. None for no limit
+        :param perHost: int, maximum requests in flight at once to a single server. None for no limit
+        """
+        for name, value in (("total", total), ("perHost", perHost)):
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 1):
+                raise ValueError("{} must be a positive integer or None".format(name))
+
+        self.total = total
+        self.perHost = perHost
+        self.active = 0
+        self.hosts = {}  # host: requests in flight
+        self.flows = ODict()  # flow: deque of waiters, in the order flows are served
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self):
+        with self._lock:
+            return sum(len(waiters) for waiters in self.flows.values())
+
+    def _free(self, host):
+        return ((self.total is None or self.active < self.total) and
+                (self.perHost is None or self.hosts.get(host, 0) < self.perHost))
+
+    def _take(self, host):
+        self.active += 1
+        self.hosts[host] = self.hosts.get(host, 0) + 1
+
+    def _give(self, host):
+        self.active -= 1
+        self.hosts[host] -= 1
+        if not self.hosts[host]:
+            del self.hosts[host]
+
+    def _dispatch(self):
+        """
+        Grants free slots to waiters taking one waiter from each flow in turn.
+        Must be called with the lock held.
+        """
+        while self.flows and (self.total is None or self.active < self.total):
+            for flow, waiters in self.flows.items():
+                waiter = next((waiter for waiter in waiters if self._free(waiter[0])), None)
+                if waiter is not None:
+                    break
+            else:
+                return  # every waiting request is for a server that is busy
+
+            waiters.remove(waiter)
+            if waiters:
+                self.flows.move_to_end(flow)  # served last next round
+            else:
+                del self.flows[flow]
+
+            host, loop, future = waiter
+            self._take(host)
+            try:
+                loop.call_soon_threadsafe(_grant, future)
+            except RuntimeError:  # the waiter's loop was closed
+                self._give(host)
+
+    async def acquire(self, host, flow=None):
+        """
+        Waits until a request to host may be sent.  Every acquire must be followed by release.
+
+        :param host: string, server key such as scheme://host:port
+        :param flow: hashable identifying the fan-out the request belongs to
+        """
+        loop = asyncio.get_event_loop()  # the running loop, get_running_loop needs python 3.7
+        future = loop.create_future()
+        waiter = (host, loop, future)
+
+        with self._lock:
+            if not self.flows and self._free(host):  # nothing queued, no need to wait
+                self._take(host)
+                return
+
+            self.flows.setdefault(flow, deque()).append(waiter)
+            self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                waiters = self.flows.get(flow)
+                if waiters is not None and waiter in waiters:
+                    waiters.remove(waiter)
+                    if not waiters:
+                        del self.flows[flow]
+                    raise
+
+            self.release(host)  # the slot was granted before the cancellation arrived
+            raise
+
+    def release(self, host):
+        """
+        Frees the slot taken by acquire once the request to host has completed.
+        """
+        with self._lock:
+            self._give(host)
+            self._dispatch()
+
+
+def _grant(future):
+    if not future.done():
+        future.set_result(True)
+
+
+def _packRequest(method, host, port, target, headers, body):
+    lines = ["{0} {1} HTTP/1.1".format(method, target)]
+    keys = [key.lower() for key in headers]
+
+    if "host" not in keys:
+        lines.append("Host: {0}:{1}".format(host, port))
+
+    if "accept-encoding" not in keys:
+        lines.append("Accept-Encoding: identity")
+
+    for key, value in headers.items():
+        lines.append("{0}: {1}".format(key, value))
+
+    if body or method != u"GET":
+        lines.append("Content-Length: {0}".format(len(body)))
+
+    head = "\r\n".join(lines) + "\r\n\r\n"
+
+    return head.encode("iso-8859-1") + body
+
+
+async def _readBody(reader, method, status, headers):
+    if method == u"HEAD" or status in (204, 304) or 100 <= status < 200:
+        return b''
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        chunks = []
+        while True:
+            line = await reader.readline()
+            size = int(line.split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass  # discard trailers
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+
+        return b"".join(chunks)
+
+    if "content-length" in headers:
+        return await reader.readexactly(int(headers["content-length"]))
+
+    return await reader.read()
+
+
+class NoResponseError(ConnectionError):
+    """
+    The connection failed before any part of the response was read.
+    """
+
+
+async def _readResponse(reader, method):
+    try:
+        line = await reader.readline()
+    except ConnectionError as ex:
+        raise NoResponseError(str(ex)) from ex
+
+    if not line:
+        raise NoResponseError("Connection closed before response")
+
+    version, status, reason = (line.decode("iso-8859-1").rstrip("\r\n").split(" ", 2) + [""])[:3]
+    status = int(status)
+
+    headers = odict()
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("iso-8859-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    body = await _readBody(reader, method, status, headers)
+
+    connection = headers.get("connection", "").lower()
+    if version == "HTTP/1.0":
+        reusable = connection == "keep-alive"
+    else:
+        reusable = connection != "close"
+    # a body without a length was read until the server closed the connection
+    reusable = reusable and ("content-length" in headers or "transfer-encoding" in headers or not body)
+
+    return reusable, odict([('version', version),
+                  ('status', status),
+                  ('reason', reason),
+                  ('headers', headers),
+                  ('body', body)])
+
+
+async def _exchange(method, scheme, host, port, target, headers, body):
+    pool = getPool()
+    message = _packRequest(method, host, port, target, headers, body)
+
+    while True:
+        reader, writer, reused = await pool.acquire(scheme, host, port)
+
+        try:
+            try:
+                writer.write(message)
+                await writer.drain()
+            except ConnectionError as ex:
+                raise NoResponseError(str(ex)) from ex
+
+            reusable, response = await _readResponse(reader, method)
+        except NoResponseError:
+            writer.close()
+            # server closed the idle connection, retry on a new one unless the
+            # request may already have been applied
+            if reused and method in IDEMPOTENT:
+                continue
+            raise
+        except BaseException:
+            writer.close()
+            raise
+
+        if reusable:
+            pool.release(scheme, host, port, reader, writer)
+        else:
+            writer.close()
+
+        return response
+
+
+async def asyncRequest(method=u'GET',
+                       scheme=u'',  # default if not in path
+                       host=u'localhost',  # default if not in path
+                       port=None,  # default if not in path
+                       path=u'/',
+                       qargs=None,
+                       headers=None,
+                       body=b'',
+                       data=None,
+                       timeout=None):
+    """
+    Perform async ReST request to a didery server using asyncio streams.
+    Mirrors helping.httpRequest so the two transports are interchangeable.
+    Connections are kept alive and reused through this thread's ConnectionPool.
+
+    Usage: (Inside a coroutine)
+
+        response = await asyncRequest()
+
+    response is an odict with version, status, reason, headers and body fields
+    or None if the request timed out or the connection failed.
+
+    path can be full url with host port etc  path takes precedence over others
+
+    :param timeout: float, seconds to wait for the complete response.
+                    Defaults to the value set with setTimeout()
+    """
+    timeout = getTimeout() if timeout is None else timeout
+    splits = urlsplit(path)
+    scheme = (splits.scheme or scheme or u"http").lower()
+    host = splits.hostname or host
+    port = splits.port or port or (443 if scheme == u"https" else 80)
+
+    target = quote(splits.path) or u"/"
+    query = splits.query
+    if qargs:
+        query = "&".join(filter(None, [query, urlencode(qargs)]))
+    if query:
+        target += "?" + query
+
+    if headers is None:
+        headers = odict([('Accept', 'application/json'),
+                         ('Connection', 'keep-alive')])
+    else:
+        headers = odict(headers)
+
+    if method == u"GET":  # do not send body on GET
+        body = b''
+    elif data is not None:  # data takes precedence
+        body = json.dumps(data, separators=(',', ':')).encode()
+        headers['Content-Type'] = 'application/json; charset=utf-8'
+
+    console.concise("Making Request {0} {1} ...\n".format(method, path))
+
+    try:
+        return await asyncio.wait_for(_exchange(method, scheme, host, port, target, headers, body), timeout)
+    except asyncio.TimeoutError:
+        return None  # timed out
+    except (OSError, ValueError, asyncio.IncompleteReadError) as ex:
+        console.terse("Error: Servicing request. '{0}'\n".format(ex))
+        return None
+
+
+setLimiter(RequestLimiter())
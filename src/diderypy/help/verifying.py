@@ -0,0 +1,206 @@
+"""
+Parallel signature verification for long event histories.
+
+Checking the chains returned for a did with thousands of rotations means
+verifying thousands of Ed25519 signatures per server.  A ParallelVerifier splits
+the checks that are not already in signing's verdicts cache into batches and
+verifies them on a pool of workers.  libnacl releases the GIL while libsodium
+verifies so threads run in parallel; a process pool can be used instead where
+that is not enough.  Checks are handed to the pool in batches so the cost of
+queueing, and for processes pickling, them stays small next to verifying them.
+Inputs with fewer checks than threshold are not worth that cost and are
+verified inline.
+
+No verifier is set by default so verification runs inline unless one is set
+with setVerifier or the "verify" field of the config file.
+"""
+import os
+import threading
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from ..lib import generating as gen
+from . import signing
+
+
+THREAD = "thread"
+PROCESS = "process"
+EXECUTORS = (THREAD, PROCESS)
+
+DEFAULT_THRESHOLD = 256  # checks below which verification runs inline
+DEFAULT_BATCH = 64  # checks handed to a worker at once
+
+_verifier = None
+
+
+def verifyBatch(checks):
+    """
+    Returns the verify result of every check in checks.  Runs in the pool's workers,
+    which keep their own verkey cache.
+
+    :param checks: list of (signature, message, verkey) tuples as for signing.verify64u
+    """
+    return [signature is not None and verkey is not None and
+            signing.verify(gen.key64uToKey(signature), message, signing.key64uToVerkey(verkey))
+            for signature, message, verkey in checks]
+
+
+class ParallelVerifier:
+    """
+    ParallelVerifier verifies lists of signature checks on a pool of threads or processes.
+    The pool is started on first use and reused until close is called.
+    """
+    def __init__(self,
+                 workers=None,
+                 threshold=DEFAULT_THRESHOLD,
+                 batch=DEFAULT_BATCH,
+                 executor=THREAD):
+        """
+        Initialize a ParallelVerifier object
+
+        :param workers: int, threads or processes in the pool. Defaults to the number of cpus
+        :param threshold: int, fewer checks than this that are not cached are verified inline
+        :param batch: int, checks handed to a worker at once
+        :param executor: THREAD or PROCESS
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+
+        if threshold < 0:
+            raise ValueError("threshold cannot be negative")
+
+        if batch < 1:
+            raise ValueError("batch must be at least 1")
+
+        if executor not in EXECUTORS:
+            raise ValueError("executor must be one of {}".format(", ".join(EXECUTORS)))
+
+        self.workers = workers
+        self.threshold = threshold
+        self.batch = batch
+        self.executor = executor
+        self._pool = None
+        self._futures = set()  # batches submitted and not yet finished
+        self._lock = threading.Lock()
+
+    def pool(self):
+        """
+        Returns the worker pool, starting it if needed.
+        """
+        with self._lock:
+            if self._pool is None:
+                if self.executor == PROCESS:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix="verifier")
+
+            return self._pool
+
+    def close(self):
+        with self._lock:
+            for future in self._futures:  # shutdown(cancel_futures=True) needs python 3.9
+                future.cancel()
+            self._futures.clear()
+
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+    def verify(self, checks):
+        """
+        Returns True if every check is valid.  Results already in signing's verdicts
+        cache are used without verifying again and new results are added to it.
+        Stops handing out batches as soon as one check fails.
+
+        :param checks: list of (signature, message, verkey) tuples as for signing.verify64u
+        """
+        pending = []
+
+        for check in checks:
+            signature, message, verkey = check
+            if signature is None or verkey is None:
+                return False
+
+            verdict = signing.verdicts.get(signing.verdictKey(signature, message, verkey))
+            if verdict is False:
+                return False
+            if verdict is None:
+                pending.append(check)
+
+        if len(pending) < max(self.threshold, 1) or self.workers == 1:
+            return all(signing.verify64u(*check) for check in pending)
+
+        pool = self.pool()
+        futures = dict((pool.submit(verifyBatch, pending[i:i + self.batch]), pending[i:i + self.batch])
+                       for i in range(0, len(pending), self.batch))
+
+        submitted = list(futures)
+
+        with self._lock:
+            self._futures.update(submitted)
+
+        try:
+            while futures:
+                done, waiting = wait(futures.keys(), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    batch = futures.pop(future)
+                    results = future.result()
+
+                    for (signature, message, verkey), verdict in zip(batch, results):
+                        signing.verdicts.put(signing.verdictKey(signature, message, verkey), verdict)
+
+                    if not all(results):
+                        return False
+        finally:
+            for future in futures:
+                future.cancel()
+
+            with self._lock:
+                self._futures.difference_update(submitted)
+
+        return True
+
+
+def setVerifier(verifier):
+    """
+    Sets the ParallelVerifier used to verify event chains, closing the one it replaces.
+
+    :param verifier: ParallelVerifier or None to verify inline
+    """
+    global _verifier
+
+    if _verifier is not None and _verifier is not verifier:
+        _verifier.close()
+
+    _verifier = verifier
+
+
+def getVerifier():
+    """
+    Returns the ParallelVerifier in use or None if signatures are verified inline.
+    """
+    return _verifier
+
+
+def configure(config):
+    """
+    Applies the verify settings found in a parsed config file.  Without a "verify"
+    field signatures are verified inline.
+
+    :param config: dict as returned by helping.parseConfigFile
+    """
+    verify = config.get("verify")
+
+    if verify is None:
+        setVerifier(None)
+        return
+
+    setVerifier(ParallelVerifier(workers=verify.get("workers"),
+                                 threshold=verify.get("threshold", DEFAULT_THRESHOLD),
+                                 batch=verify.get("batch", DEFAULT_BATCH),
+                                 executor=verify.get("executor", THREAD)))
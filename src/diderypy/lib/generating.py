@@ -5,7 +5,6 @@ import stat
 import os
 
 import diderypy.lib.didering as didering
-from diderypy.help import helping as help
 
 """
 This module provides various key generation and manipulation functions for use with the didery server.  
@@ -186,6 +185,8 @@ class DidBox(libnacl.base.BaseKey):
             if (os.stat(path).st_mode & 0o777) != 0o600:
                 raise PermissionError("Insecure key file permissions!")
 
+            from diderypy.help import helping as help  # imported here to avoid a circular import
+
             data = help.parseKeyFile(path)
 
             self.sk = data['priv']
@@ -1,18 +1,19 @@
 from ..help import helping as h
 from ..help import consensing
+from ..help import transporting as t
 
 
-def __patronHelper(method="GET", path="event", headers=None, data=None):
-    result = yield from h.httpRequest(method, path=path, headers=headers, data=data)
+def getHistoryEvents(did, urls, known=None, prefix=False):
+    return t.run(awaitHistoryEvents(did, urls, known, prefix))
 
-    if result:
-        return result['body'].decode(), result.get('status')
-    else:
-        return None
 
-
-def getHistoryEvents(did, urls):
-    consense = consensing.CompositeConsense()
+async def awaitHistoryEvents(did, urls, known=None, prefix=False):
+    """
+    Coroutine version of getHistoryEvents for code running on an asyncio event loop.
+    The requests run on the caller's loop.
+    """
+    # events equal to a known event were verified by an earlier call
+    consense = consensing.CompositeConsense(known=known)
     if not urls:
         raise ValueError("At least one url required.")
 
@@ -20,11 +21,17 @@ def getHistoryEvents(did, urls):
 
     for url in urls:
         endpoint = "{0}/{1}/{2}".format(url, "event", did)
-        generators[endpoint] = __patronHelper(path=endpoint)
+        generators[endpoint] = h.request(path=endpoint)
 
-    data = h.awaitAsync(generators)
-    print(data)
+    data = await h.awaitAll(generators, idempotent=True)
     events, results = consense.consense(data)
+
+    if prefix:  # the longest chain a majority agrees on and where the servers diverge
+        agreed, divergence = consense.checkPrefix(len(data))
+        events = {"events": agreed, "divergence": divergence} if agreed else None
+
+        return events, results
+
     events = {"events": events} if events else events
 
     return events, results
@@ -7,19 +7,13 @@ except ImportError:
 
 from ..help import helping as h
 from ..help import consensing
+from ..help import caching
+from ..help import coalescing
 from ..help import signing as sign
+from ..help import transporting as t
 from ..lib import generating as gen
 
 
-def __patronHelper(method="GET", path="history", headers=None, data=None):
-    result = yield from h.httpRequest(method, path=path, headers=headers, data=data)
-
-    if result:
-        return result['body'].decode(), result.get('status')
-    else:
-        return None
-
-
 # def getAllHistories(urls=None):
 #     if urls is None:
 #         urls = ["http://localhost:8080/history", "http://localhost:8000/history"]
@@ -27,27 +21,125 @@ def __patronHelper(method="GET", path="history", headers=None, data=None):
 #     generators = []
 #
 #     for url in urls:
-#         generators.append(__patronHelper(path=url))
+#         generators.append(h.request(path=url))
 #
 #     return h.awaitAsync(generators)
 
 
-def getHistory(did, urls):
-    consense = consensing.Consense()
+def getHistory(did, urls, quorum=False, cache=None, selective=False):
+    if not urls:
+        raise ValueError("At least one url required.")
+
+    # concurrent calls for the same did share one fan-out and consensus check
+    key = (caching.HISTORY, did, tuple(urls), quorum, cache, selective)
+
+    return coalescing.flights.do(key, _getHistory, did, urls, quorum, cache, selective)
+
+
+def _getHistory(did, urls, quorum, cache, selective):
+    if cache is not None:  # conditional requests and local fallback
+        return cache.consense(did, caching.HISTORY, urls, consensing.Consense(), quorum, selective)
+
+    return t.run(awaitHistory(did, urls, quorum, selective))
+
+
+async def awaitHistory(did, urls, quorum=False, selective=False):
+    """
+    Coroutine version of getHistory for code running on an asyncio event loop.
+    The requests run on the caller's loop.  Calls are not coalesced and there
+    is no cache.
+
+    :param did: W3C DID string
+    :param urls: list of url strings to query
+    :param quorum: bool, see getHistory
+    :param selective: bool, see getHistory
+    :return: tuple - history dict and dict of result strings for each url
+    """
     if not urls:
         raise ValueError("At least one url required.")
 
+    consense = consensing.Consense()
+
+    if selective:  # query the fastest majority first
+        endpoints = ["{0}/{1}/{2}".format(url, "history", did) for url in urls]
+        return await consense.awaitSelective(endpoints, lambda endpoint: h.request(path=endpoint))
+
     generators = {}
 
     for url in urls:
         endpoint = "{0}/{1}/{2}".format(url, "history", did)
-        generators[endpoint] = __patronHelper(path=endpoint)
+        generators[endpoint] = h.request(path=endpoint)
+
+    if quorum:  # return as soon as the majority is decided
+        return await consense.awaitQuorum(generators)
 
-    data = h.awaitAsync(generators)
+    data = await h.awaitAll(generators, idempotent=True)
 
     return consense.consense(data)
 
 
+def getHistories(dids, urls, limit=100):
+    """
+    Resolves the rotation histories of many dids at once.  The requests for
+    every did are sent to every server concurrently, with at most limit
+    requests in flight at a time, and consensus is checked for each did.
+
+    :param dids: iterable of W3C DID strings
+    :param urls: list of url strings to query
+    :param limit: int, maximum number of requests in flight at once
+    :return: dict of did, (history dict, results dict) pairs
+    """
+    histories = {}
+
+    for did, history, results in streamHistories(dids, urls, limit=limit):
+        histories[did] = (history, results)
+
+    return histories
+
+
+def streamHistories(dids, urls, limit=100, quorum=False):
+    """
+    Generator that resolves the rotation histories of many dids and yields
+    (did, history dict, results dict) tuples as soon as consensus is checked for
+    each did, in the order they complete.  dids is consumed lazily so very
+    large or unbounded iterables can be streamed with bounded memory.
+
+    :param dids: iterable of W3C DID strings
+    :param urls: list of url strings to query
+    :param limit: int, maximum number of requests in flight at once
+    :param quorum: bool, yield a did as soon as 2/3 of the urls agree, or
+                   agreement is no longer possible, and cancel its remaining requests
+    """
+    return h.iterateSync(iterateHistories(dids, urls, limit=limit, quorum=quorum))
+
+
+def iterateHistories(dids, urls, limit=100, quorum=False):
+    """
+    Asynchronous generator version of streamHistories for code running on an
+    asyncio event loop.  The requests run on the caller's loop.
+
+        async for did, history, results in iterateHistories(dids, urls):
+
+    :param dids: iterable of W3C DID strings
+    :param urls: list of url strings to query
+    :param limit: int, see streamHistories
+    :param quorum: bool, see streamHistories
+    """
+    if not urls:
+        raise ValueError("At least one url required.")
+
+    def groups():
+        for did in dids:
+            generators = {}
+            for url in urls:
+                endpoint = "{0}/{1}/{2}".format(url, "history", did)
+                generators[endpoint] = h.request(path=endpoint)
+
+            yield did, consensing.Consense(), generators
+
+    return h.iterateConsensus(groups(), limit=limit, quorum=quorum)
+
+
 def postHistory(data, sk, urls):
     if not urls:
         raise ValueError("At least one url required.")
@@ -59,12 +151,13 @@ def postHistory(data, sk, urls):
     data['changed'] = str(arrow.utcnow())
     bdata = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
     headers = {
+        "Content-Type": "application/json; charset=utf-8",
         "Signature": 'signer="{0}"'.format(sign.signResource(bdata, gen.key64uToKey(sk)))
     }
 
     for url in urls:
         endpoint = "{0}/{1}".format(url, "history")
-        generators[endpoint] = __patronHelper(method="POST", path=endpoint, data=data, headers=headers)
+        generators[endpoint] = h.request(method="POST", path=endpoint, body=bdata, headers=headers)
 
     return h.awaitAsync(generators)
 
@@ -84,6 +177,7 @@ def putHistory(data, sk, psk, urls):
     data['changed'] = str(arrow.utcnow())
     bdata = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
     headers = {
+        "Content-Type": "application/json; charset=utf-8",
         "Signature": 'signer="{0}"; rotation="{1}"'.format(
             sign.signResource(bdata, gen.key64uToKey(sk)),
             sign.signResource(bdata, gen.key64uToKey(psk))
@@ -92,7 +186,7 @@ def putHistory(data, sk, psk, urls):
 
     for url in urls:
         endpoint = "{0}/{1}/{2}".format(url, "history", did)
-        generators[endpoint] = __patronHelper(method="PUT", path=endpoint, data=data, headers=headers)
+        generators[endpoint] = h.request(method="PUT", path=endpoint, body=bdata, headers=headers)
 
     return h.awaitAsync(generators)
 
@@ -108,6 +202,7 @@ def deleteHistory(did, sk, urls):
     data = {"id": did}
     bdata = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
     headers = {
+        "Content-Type": "application/json; charset=utf-8",
         "Signature": 'signer="{0}"'.format(
             sign.signResource(bdata, gen.key64uToKey(sk))
         )
@@ -115,6 +210,6 @@ def deleteHistory(did, sk, urls):
 
     for url in urls:
         endpoint = "{0}/{1}/{2}".format(url, "history", did)
-        generators[endpoint] = __patronHelper(method="DELETE", path=endpoint, data=data, headers=headers)
+        generators[endpoint] = h.request(method="DELETE", path=endpoint, body=bdata, headers=headers)
 
     return h.awaitAsync(generators)
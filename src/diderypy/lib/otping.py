@@ -7,19 +7,13 @@ except ImportError:
 
 from ..help import helping as h
 from ..help import consensing
+from ..help import caching
+from ..help import coalescing
 from ..help import signing as sign
+from ..help import transporting as t
 from ..lib import generating as gen
 
 
-def __patronHelper(method="GET", path="blob", headers=None, data=None):
-    result = yield from h.httpRequest(method, path=path, headers=headers, data=data)
-
-    if result:
-        return result['body'].decode(), result.get('status')
-    else:
-        return None
-
-
 # def getAllOtpBlobs(urls=None):
 #     if urls is None:
 #         urls = ["http://localhost:8080/history", "http://localhost:8000/history"]
@@ -27,23 +21,59 @@ def __patronHelper(method="GET", path="blob", headers=None, data=None):
 #     generators = []
 #
 #     for url in urls:
-#         generators.append(__patronHelper(path=url))
+#         generators.append(h.request(path=url))
 #
 #     return h.awaitAsync(generators)
 
 
-def getOtpBlob(did, urls):
+def getOtpBlob(did, urls, quorum=False, cache=None, selective=False):
+    if not urls:
+        raise ValueError("At least one url required.")
+
+    # concurrent calls for the same did share one fan-out and consensus check
+    key = (caching.OTP, did, tuple(urls), quorum, cache, selective)
+
+    return coalescing.flights.do(key, _getOtpBlob, did, urls, quorum, cache, selective)
+
+
+def _getOtpBlob(did, urls, quorum, cache, selective):
+    if cache is not None:  # conditional requests and local fallback
+        return cache.consense(did, caching.OTP, urls, consensing.Consense(), quorum, selective)
+
+    return t.run(awaitOtpBlob(did, urls, quorum, selective))
+
+
+async def awaitOtpBlob(did, urls, quorum=False, selective=False):
+    """
+    Coroutine version of getOtpBlob for code running on an asyncio event loop.
+    The requests run on the caller's loop.  Calls are not coalesced and there
+    is no cache.
+
+    :param did: W3C DID string
+    :param urls: list of url strings to query
+    :param quorum: bool, see getOtpBlob
+    :param selective: bool, see getOtpBlob
+    :return: tuple - otp blob dict and dict of result strings for each url
+    """
     if not urls:
         raise ValueError("At least one url required.")
 
     consense = consensing.Consense()
+
+    if selective:  # query the fastest majority first
+        endpoints = ["{0}/{1}/{2}".format(url, "blob", did) for url in urls]
+        return await consense.awaitSelective(endpoints, lambda endpoint: h.request(path=endpoint))
+
     generators = {}
 
     for url in urls:
         endpoint = "{0}/{1}/{2}".format(url, "blob", did)
-        generators[endpoint] = __patronHelper(path=endpoint)
+        generators[endpoint] = h.request(path=endpoint)
+
+    if quorum:  # return as soon as the majority is decided
+        return await consense.awaitQuorum(generators)
 
-    data = h.awaitAsync(generators)
+    data = await h.awaitAll(generators, idempotent=True)
 
     return consense.consense(data)
 
@@ -59,12 +89,13 @@ def postOtpBlob(data, sk, urls):
     data['changed'] = str(arrow.utcnow())
     bdata = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
     headers = {
+        "Content-Type": "application/json; charset=utf-8",
         "Signature": 'signer="{0}"'.format(sign.signResource(bdata, gen.key64uToKey(sk)))
     }
 
     for url in urls:
         endpoint = "{0}/{1}".format(url, "blob")
-        generators[endpoint] = __patronHelper(method="POST", path=endpoint, data=data, headers=headers)
+        generators[endpoint] = h.request(method="POST", path=endpoint, body=bdata, headers=headers)
 
     return h.awaitAsync(generators)
 
@@ -81,12 +112,13 @@ def putOtpBlob(data, sk, urls):
     did = data["id"]
     bdata = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
     headers = {
+        "Content-Type": "application/json; charset=utf-8",
         "Signature": 'signer="{0}"'.format(sign.signResource(bdata, gen.key64uToKey(sk)))
     }
 
     for url in urls:
         endpoint = "{0}/{1}/{2}".format(url, "blob", did)
-        generators[endpoint] = __patronHelper(method="PUT", path=endpoint, data=data, headers=headers)
+        generators[endpoint] = h.request(method="PUT", path=endpoint, body=bdata, headers=headers)
 
     return h.awaitAsync(generators)
 
@@ -102,6 +134,7 @@ def removeOtpBlob(did, sk, urls):
     data = {"id": did}
     bdata = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
     headers = {
+        "Content-Type": "application/json; charset=utf-8",
         "Signature": 'signer="{0}"'.format(
             sign.signResource(bdata, gen.key64uToKey(sk))
         )
@@ -109,6 +142,6 @@ def removeOtpBlob(did, sk, urls):
 
     for url in urls:
         endpoint = "{0}/{1}/{2}".format(url, "blob", did)
-        generators[endpoint] = __patronHelper(method="DELETE", path=endpoint, data=data, headers=headers)
+        generators[endpoint] = h.request(method="DELETE", path=endpoint, body=bdata, headers=headers)
 
     return h.awaitAsync(generators)
@@ -4,12 +4,14 @@ except ImportError:
     import json
 
 from collections import OrderedDict as ODict
+from functools import wraps
+from hashlib import sha256
 
 from ..lib.didering import validateDid
 from ..help.signing import verify64u
 
 
-def responseFactory(url, status, data):
+def responseFactory(url, status, data, raw=None):
     """
     responseFactory()  implements the factory pattern to build objects for
     history, otp, and events data based on the format of the data that is passed to it
@@ -17,6 +19,7 @@ def responseFactory(url, status, data):
     :param url: url string that was queried
     :param status: integer representing the http response status from the request
     :param data: dict containing response data from the above url
+    :param raw: optional bytes of the response body data was parsed from
 
     :return: DideryResponse object containing in it's response field either a
              HistoryData object, OtpData object, or a dict of HistoryData objects
@@ -41,68 +44,108 @@ def responseFactory(url, status, data):
     else:
         response = AbstractDideryData(data)
 
-    return DideryResponse(url, status, response)
+    return DideryResponse(url, status, response, raw)
+
+
+def memoized(func):
+    """
+    Property decorator that computes its value once per instance and then
+    returns the stored value.  Used for values derived from response data,
+    which is not modified after it is received.
+    """
+    name = func.__name__
+
+    @wraps(func)
+    def getter(self):
+        try:
+            return self._cache[name]
+        except KeyError:
+            value = self._cache[name] = func(self)
+            return value
+
+    return property(getter)
 
 
 class DideryResponse:
     """
     DideryResponse object is a container class for storing info about a HTTP response.
     """
-    def __init__(self, url, status, response):
+    def __init__(self, url, status, response, raw=None):
         """
 
         :param url: url string that was queried
         :param status: integer representing the http response status from the request
         :param response: dict or model containing response data from the above url
+        :param raw: optional bytes of the response body exactly as it was received
         """
         self.url = url
         self.status = status
         self.response = response
+        self.raw = raw
+
+    def _fields(self):
+        return ODict([("url", self.url), ("status", self.status), ("response", self.response)])
 
     def __str__(self):
-        return str(ODict(self.__dict__)).replace("OrderedDict", "")
+        return str(self._fields()).replace("OrderedDict", "")
 
     def __repr__(self):
-        return str(ODict(self.__dict__)).replace("OrderedDict", "DideryResponse")
+        return str(self._fields()).replace("OrderedDict", "DideryResponse")
 
 
 class AbstractDideryData:
     """
         AbstractDideryData object is an abstract parent class for storing response data from didery servers.
+        Values derived from data, including the result of signature validation, are computed
+        once and reused so data must not be modified after the object is created.
     """
 
     def __init__(self, data):
         self._data = data
+        self._cache = {}
 
     @property
     def data(self):
         return self._data
 
-    @property
+    @memoized
     def bdata(self):
         return json.dumps(self._data, ensure_ascii=False, separators=(",", ":")).encode()
 
-    @property
+    @memoized
     def body(self):
         return None
 
-    @property
+    @memoized
     def bbody(self):
         return json.dumps(self.body, ensure_ascii=False, separators=(",", ":")).encode()
 
-    @property
+    @memoized
+    def digest(self):
+        """
+        sha256 digest of the signed body and the signatures.  Data that carries the
+        same signed bytes and signatures has the same digest however it was formatted.
+        """
+        signatures = json.dumps(self._data["signatures"], sort_keys=True, separators=(",", ":")).encode()
+        digest = sha256(self.bbody)
+        digest.update(b"\x00")
+        digest.update(signatures)
+
+        return digest.digest()
+
+    @memoized
     def did(self):
         return self.body["id"]
 
-    @property
+    @memoized
     def vk(self):
         return None
 
-    @property
+    @memoized
     def signature(self):
         return None
 
-    @property
+    @memoized
     def valid(self):
         return verify64u(self.signature, self.bbody, self.vk)
 
@@ -123,19 +166,19 @@ class HistoryData(AbstractDideryData):
         """
         AbstractDideryData.__init__(self, data)
 
-    @property
+    @memoized
     def body(self):
         if "deleted" in self._data:
             return self._data["deleted"]["history"]
         else:
             return self._data["history"]
 
-    @property
+    @memoized
     def vk(self):
         signer = int(self.body["signer"])
         return self.body["signers"][signer]
 
-    @property
+    @memoized
     def previous_vk(self):
         signer = int(self.body["signer"])
         if signer == 0:
@@ -143,25 +186,25 @@ class HistoryData(AbstractDideryData):
 
         return self.body["signers"][signer-1]
 
-    @property
+    @memoized
     def signer_sig(self):
         return self._data["signatures"]["signer"]
 
-    @property
+    @memoized
     def rotation_sig(self):
         if "rotation" in self._data["signatures"]:
             return self._data["signatures"]["rotation"]
         else:
             return None
 
-    @property
+    @memoized
     def signature(self):
         if self.rotation_sig:
             return self.rotation_sig
         else:
             return self.signer_sig
 
-    @property
+    @memoized
     def valid(self):
         if self.rotation_sig:
             rotation = verify64u(self.rotation_sig, self.bbody, self.vk)
@@ -192,18 +235,18 @@ class OtpData(AbstractDideryData):
         """
         AbstractDideryData.__init__(self, data)
 
-    @property
+    @memoized
     def body(self):
         if "deleted" in self._data:
             return self._data["deleted"]["otp_data"]
         else:
             return self._data["otp_data"]
 
-    @property
+    @memoized
     def vk(self):
         did, vk = validateDid(self.body["id"])
         return vk
 
-    @property
+    @memoized
     def signature(self):
         return self._data["signatures"]["signer"]
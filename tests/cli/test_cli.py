@@ -64,6 +64,96 @@ def testMissingConfigFields():
         assert result.exit_code == 0
         assert result.output == "Error parsing the config file: Missing required field servers.\n"
 
+
+def testInvalidConfigTimeout():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        with open('config.json', 'w') as f:
+            f.write('{"servers": ["http://localhost:8080", "http://localhost:8000"], "timeout": -1}')
+
+        result = runner.invoke(main, ['config.json', '--upload'])
+
+        assert result.exit_code == 0
+        assert result.output == "Error parsing the config file: \"timeout\" field must be a positive number of seconds.\n"
+
+
+def testInvalidConfigBreaker():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        for breaker, error in (('3', '"breaker" field must be a dict'),
+                               ('{"threshold": -1}', '"breaker" threshold must be an integer of at least 0'),
+                               ('{"cooldown": "30"}', '"breaker" cooldown must be a number of at least 0'),
+                               ('{"max_cooldown": 10}', '"breaker" max_cooldown must be a number of at least cooldown')):
+            with open('config.json', 'w') as f:
+                f.write('{"servers": ["http://localhost:8080", "http://localhost:8000"], "breaker": %s}' % breaker)
+
+            result = runner.invoke(main, ['config.json', '--upload'])
+
+            assert result.exit_code == 0
+            assert result.output == "Error parsing the config file: {}.\n".format(error)
+
+
+def testInvalidConfigPool():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        for pool, error in (('{"max_per_host": "8"}', '"pool" max_per_host must be an integer of at least 0'),
+                            ('{"max_per_host": -1}', '"pool" max_per_host must be an integer of at least 0'),
+                            ('{"idle_timeout": -1.0}', '"pool" idle_timeout must be a number of at least 0')):
+            with open('config.json', 'w') as f:
+                f.write('{"servers": ["http://localhost:8080", "http://localhost:8000"], "pool": %s}' % pool)
+
+            result = runner.invoke(main, ['config.json', '--upload'])
+
+            assert result.exit_code == 0
+            assert result.output == "Error parsing the config file: {}.\n".format(error)
+
+
+def testInvalidConfigHedge():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        for hedge, error in (('{"percentile": 0}', '"hedge" percentile must be a number above 0 and at most 100 or null'),
+                             ('{"percentile": 101}', '"hedge" percentile must be a number above 0 and at most 100 or null'),
+                             ('{"budget": "x"}', '"hedge" budget must be a number of at least 0'),
+                             ('{"budget": -0.1}', '"hedge" budget must be a number of at least 0')):
+            with open('config.json', 'w') as f:
+                f.write('{"servers": ["http://localhost:8080", "http://localhost:8000"], "hedge": %s}' % hedge)
+
+            result = runner.invoke(main, ['config.json', '--upload'])
+
+            assert result.exit_code == 0
+            assert result.output == "Error parsing the config file: {}.\n".format(error)
+
+
+def testInvalidConfigConcurrency():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        for concurrency, error in (('{"total": 0}', '"concurrency" total must be a positive integer or null'),
+                                   ('{"per_host": 1.5}', '"concurrency" per_host must be a positive integer or null')):
+            with open('config.json', 'w') as f:
+                f.write('{"servers": ["http://localhost:8080", "http://localhost:8000"], "concurrency": %s}' % concurrency)
+
+            result = runner.invoke(main, ['config.json', '--upload'])
+
+            assert result.exit_code == 0
+            assert result.output == "Error parsing the config file: {}.\n".format(error)
+
+
+def testInvalidConfigVerify():
+    runner = CliRunner()
+    with runner.isolated_filesystem():
+        for verify, error in (('{"workers": 0}', '"verify" workers must be an integer of at least 1'),
+                              ('{"batch": "64"}', '"verify" batch must be an integer of at least 1'),
+                              ('{"threshold": -1}', '"verify" threshold must be an integer of at least 0'),
+                              ('{"executor": "fiber"}', '"verify" executor must be one of thread, process')):
+            with open('config.json', 'w') as f:
+                f.write('{"servers": ["http://localhost:8080", "http://localhost:8000"], "verify": %s}' % verify)
+
+            result = runner.invoke(main, ['config.json', '--upload'])
+
+            assert result.exit_code == 0
+            assert result.output == "Error parsing the config file: {}.\n".format(error)
+
+
 # TODO figure out why these fail when run with other tests
 # def testValidInceptionDataFile():
 #     runner = CliRunner()
@@ -0,0 +1,337 @@
+"""
+In process stand-in for a didery server.
+
+FakeServer implements the /history, /blob and /event endpoints of didery well
+enough to run historying, otping and history_eventing end to end on a single
+machine.  Every instance listens on its own localhost port and can be made to
+misbehave with added latency, jitter, errors, timeouts and forged responses so
+that consensus and transport code can be tested and benchmarked reproducibly.
+Writes are stored without checking their signatures, so it is only a test helper.
+"""
+import asyncio
+import copy
+import random
+import re
+import threading
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from urllib.parse import urlsplit, unquote
+
+
+HISTORY = "history"
+OTP = "blob"
+EVENT = "event"
+
+REASONS = {
+    200: "OK",
+    201: "Created",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error"
+}
+
+SIGNATURE = re.compile(r'(\w+)\s*=\s*"([^"]*)"')
+
+
+def parseSignatures(header):
+    """
+    Returns a dict of the tagged signatures in a Signature header.
+
+    :param header: string, e.g. signer="..."; rotation="..."
+    """
+    return dict(SIGNATURE.findall(header or ""))
+
+
+def forge(record):
+    """
+    Returns a copy of a stored record whose signed data has been altered so
+    its signatures no longer verify.
+
+    :param record: dict or list as served by FakeServer
+    """
+    record = copy.deepcopy(record)
+
+    if isinstance(record, list):  # events, forge the latest
+        if record:
+            record[-1]["event"]["forged"] = True
+        return record
+
+    body = record.get("deleted", record)
+    for key in ("history", "otp_data"):
+        if key in body:
+            body[key]["forged"] = True
+
+    return record
+
+
+class FakeServer:
+    """
+    FakeServer serves didery requests from an asyncio event loop running in a
+    background thread.  Data is kept in memory in the history, blobs and events
+    dicts which can also be filled directly, e.g. to give one server divergent data.
+    """
+    def __init__(self,
+                 host="127.0.0.1",
+                 port=0,
+                 latency=0.0,
+                 jitter=0.0,
+                 errorRate=0.0,
+                 timeoutRate=0.0,
+                 forgeRate=0.0,
+                 seed=None):
+        """
+        Initialize a FakeServer object
+
+        :param host: string, interface to listen on
+        :param port: int, port to listen on. 0 picks a free port
+        :param latency: float, seconds added before each response
+        :param jitter: float, maximum seconds randomly added to or removed from latency
+        :param errorRate: float, 0-1 fraction of requests answered with 500 Internal Server Error
+        :param timeoutRate: float, 0-1 fraction of requests that are never answered
+        :param forgeRate: float, 0-1 fraction of GET requests answered with data whose
+                          signatures do not verify
+        :param seed: optional seed for the random faults so runs are reproducible
+        """
+        for name, rate in (("errorRate", errorRate), ("timeoutRate", timeoutRate), ("forgeRate", forgeRate)):
+            if not 0.0 <= rate <= 1.0:
+                raise ValueError("{} must be between 0 and 1".format(name))
+
+        if latency < 0 or jitter < 0:
+            raise ValueError("latency and jitter cannot be negative")
+
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.errorRate = errorRate
+        self.timeoutRate = timeoutRate
+        self.forgeRate = forgeRate
+        self.random = random.Random(seed)
+
+        self.history = {}  # did: {"history": data, "signatures": signatures}
+        self.blobs = {}  # did: {"otp_data": data, "signatures": signatures}
+        self.events = {}  # did: [{"event": data, "signatures": signatures}, ...]
+        self.requests = 0
+
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._tasks = set()  # connection handlers, asyncio.all_tasks needs python 3.7
+        self._loop = None
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def url(self):
+        return "http://{0}:{1}".format(self.host, self.port)
+
+    def start(self):
+        """
+        Starts serving in a background thread and returns self once the server is listening.
+        """
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(
+            asyncio.start_server(self._accept, self.host, self.port)
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def stop(self):
+        """
+        Stops the server and closes all of its connections.
+        """
+        if self._loop is None:
+            return
+
+        async def shutdown():
+            self._server.close()
+            for writer in list(self._connections):
+                writer.transport.abort()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    def store(self, kind, did, record):
+        """
+        Stores a record as if it had been written to the server.
+
+        :param kind: HISTORY, OTP or EVENT
+        :param did: W3C DID string
+        :param record: dict for HISTORY and OTP, list of events for EVENT
+        """
+        with self._lock:
+            self._records(kind)[did] = record
+
+    def _records(self, kind):
+        return {HISTORY: self.history, OTP: self.blobs, EVENT: self.events}[kind]
+
+    def _accept(self, reader, writer):
+        task = self._loop.create_task(self._handle(reader, writer))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                lines = head.decode("iso-8859-1").split("\r\n")
+                method, target, version = (lines[0].split(" ") + ["", ""])[:3]
+                headers = {}
+                for line in lines[1:]:
+                    key, _, value = line.partition(":")
+                    if key:
+                        headers[key.strip().lower()] = value.strip()
+
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                with self._lock:
+                    self.requests += 1
+
+                delay = self.latency + self.random.uniform(-self.jitter, self.jitter)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                if self.random.random() < self.timeoutRate:
+                    await reader.read()  # never respond, wait for the client to hang up
+                    break
+
+                if self.random.random() < self.errorRate:
+                    status, data = 500, {"title": "500 Internal Server Error"}
+                else:
+                    status, data = self._respond(method, unquote(urlsplit(target).path), headers, body)
+
+                payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+                keepAlive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                writer.write("HTTP/1.1 {0} {1}\r\n"
+                             "Content-Type: application/json; charset=UTF-8\r\n"
+                             "Content-Length: {2}\r\n"
+                             "Connection: {3}\r\n\r\n".format(status,
+                                                             REASONS.get(status, ""),
+                                                             len(payload),
+                                                             "keep-alive" if keepAlive else "close").encode())
+                writer.write(payload)
+                await writer.drain()
+
+                if not keepAlive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    def _respond(self, method, path, headers, body):
+        parts = [part for part in path.split("/") if part]
+        if not parts or parts[0] not in (HISTORY, OTP, EVENT) or len(parts) > 2:
+            return 404, {"title": "404 Not Found"}
+
+        kind = parts[0]
+        did = parts[1] if len(parts) == 2 else None
+
+        with self._lock:
+            if method == "GET":
+                return self._get(kind, did)
+
+            if kind == EVENT:
+                return 405, {"title": "405 Method Not Allowed"}
+
+            signatures = parseSignatures(headers.get("signature"))
+            if not signatures.get("signer"):
+                return 400, {"title": "Missing Signature", "description": "Signature header required."}
+
+            try:
+                data = json.loads(body.decode()) if body else {}
+            except ValueError:
+                return 400, {"title": "Malformed Body", "description": "Body must be json."}
+
+            if method == "POST" and did is None:
+                return self._post(kind, data, signatures)
+
+            if method == "PUT" and did is not None:
+                return self._put(kind, did, data, signatures)
+
+            if method == "DELETE" and did is not None:
+                return self._delete(kind, did)
+
+        return 405, {"title": "405 Method Not Allowed"}
+
+    def _get(self, kind, did):
+        records = self._records(kind)
+        if did is None or did not in records:
+            return 404, {"title": "404 Not Found", "description": "{} not found.".format(did)}
+
+        record = records[did]
+        if self.random.random() < self.forgeRate:
+            record = forge(record)
+
+        return 200, record
+
+    def _post(self, kind, data, signatures):
+        did = data.get("id")
+        records = self._records(kind)
+
+        if did is None:
+            return 400, {"title": "Malformed Body", "description": "id field required."}
+
+        if did in records:
+            return 400, {"title": "Resource Already Exists", "description": "{} already exists.".format(did)}
+
+        key = HISTORY if kind == HISTORY else "otp_data"
+        records[did] = {key: data, "signatures": signatures}
+
+        if kind == HISTORY:
+            self.events[did] = [{"event": data, "signatures": signatures}]
+
+        return 201, records[did]
+
+    def _put(self, kind, did, data, signatures):
+        records = self._records(kind)
+
+        if did not in records:
+            return 404, {"title": "404 Not Found", "description": "{} not found.".format(did)}
+
+        if data.get("id") != did:
+            return 400, {"title": "Malformed Body", "description": "Url did must match id field."}
+
+        key = HISTORY if kind == HISTORY else "otp_data"
+        records[did] = {key: data, "signatures": signatures}
+
+        if kind == HISTORY:
+            self.events.setdefault(did, []).append({"event": data, "signatures": signatures})
+
+        return 200, records[did]
+
+    def _delete(self, kind, did):
+        records = self._records(kind)
+
+        if did not in records:
+            return 404, {"title": "404 Not Found", "description": "{} not found.".format(did)}
+
+        if kind == HISTORY:
+            self.events.pop(did, None)
+
+        return 200, {"deleted": records.pop(did)}
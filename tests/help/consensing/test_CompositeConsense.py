@@ -1,7 +1,13 @@
-from hashlib import sha256
-from collections import OrderedDict as ODict
+try:
+    import simplejson as json
+except ImportError:
+    import json
 
 from diderypy.help import consensing
+from diderypy.help import signing
+from diderypy.help import verifying
+from diderypy.lib import generating as gen
+from diderypy.models import responding
 from tests.data import history_data_builder as builder
 
 
@@ -30,7 +36,7 @@ def testValidateDataInvalidSigsIncompleteMajority():
     consense.validateData(data)
 
     exp_data = response1.historyBuilder.build()
-    sha = sha256(str(ODict(exp_data)).encode()).hexdigest()
+    sha = consensing.eventsDigest(exp_data)
 
     assert sha in consense.valid_data
     assert consense.valid_data[sha]['0'] == exp_data['0'].data
@@ -71,7 +77,7 @@ def testValidateDataMajorityPasses():
     consense.validateData(data)
 
     exp_data = response1.historyBuilder.build()
-    sha = sha256(str(ODict(exp_data)).encode()).hexdigest()
+    sha = consensing.eventsDigest(exp_data)
 
     assert sha in consense.valid_data
     assert consense.valid_data[sha]['0'] == exp_data['0'].data
@@ -104,9 +110,9 @@ def testValidateDataValidSigsConflictingData():
     consense.validateData(data)
 
     exp_data = response1.historyBuilder.build()
-    sha = sha256(str(ODict(exp_data)).encode()).hexdigest()
+    sha = consensing.eventsDigest(exp_data)
     bad_exp_data = response2.historyBuilder.build()
-    bad_sha = sha256(str(ODict(bad_exp_data)).encode()).hexdigest()
+    bad_sha = consensing.eventsDigest(bad_exp_data)
 
     assert sha in consense.valid_data
     assert consense.valid_data[sha]['0'] == exp_data['0'].data
@@ -148,9 +154,9 @@ def testValidateDataIncompleteMajority():
     consense.validateData(data)
 
     exp_data = response1.historyBuilder.build()
-    sha = sha256(str(ODict(exp_data)).encode()).hexdigest()
+    sha = consensing.eventsDigest(exp_data)
     bad_exp_data = response2.historyBuilder.build()
-    bad_sha = sha256(str(ODict(bad_exp_data)).encode()).hexdigest()
+    bad_sha = consensing.eventsDigest(bad_exp_data)
 
     assert len(consense.valid_data) == 2
 
@@ -186,7 +192,7 @@ def testValidateDataWithHTTPError():
     consense.validateData(data)
 
     exp_data = response1.historyBuilder.build()
-    sha = sha256(str(ODict(exp_data)).encode()).hexdigest()
+    sha = consensing.eventsDigest(exp_data)
 
     assert len(consense.valid_data) == 1
     assert sha in consense.valid_data
@@ -216,7 +222,7 @@ def testValidateDataWithTimeOut():
     consense.validateData(data)
 
     exp_data = response1.historyBuilder.build()
-    sha = sha256(str(ODict(exp_data)).encode()).hexdigest()
+    sha = consensing.eventsDigest(exp_data)
 
     assert len(consense.valid_data) == 1
     assert sha in consense.valid_data
@@ -246,7 +252,7 @@ def testValidateDataWith200StatusNoData():
     consense.validateData(data)
 
     exp_data = response1.historyBuilder.build()
-    sha = sha256(str(ODict(exp_data)).encode()).hexdigest()
+    sha = consensing.eventsDigest(exp_data)
 
     assert len(consense.valid_data) == 1
     assert sha in consense.valid_data
@@ -256,3 +262,160 @@ def testValidateDataWith200StatusNoData():
     assert consense.valid_match_counts == {
         sha: 1
     }
+
+
+def testEventsDigest():
+    events = builder.CompositeHistoryBuilder().withRotations(10).build()
+    reordered = dict(reversed(list(events.items())))
+    same = builder.CompositeHistoryBuilder().withRotations(10).build()
+    invalid = builder.CompositeHistoryBuilder().withRotations(10).withInvalidRotationSigAt(3).build()
+
+    digest = consensing.eventsDigest(events)
+
+    assert list(reordered.keys()) != list(events.keys())
+    assert consensing.eventsDigest(reordered) == digest
+    assert consensing.eventsDigest(same) == digest
+    assert consensing.eventsDigest(invalid) != digest  # signatures are part of the digest
+    assert consensing.eventsDigest(dict(list(events.items())[:-1])) != digest
+
+
+def testChainTreeAgreed():
+    events = builder.CompositeHistoryBuilder().withRotations(20).build()
+    other = builder.CompositeHistoryBuilder().withRotations(20).withInvalidRotationSigAt(13).build()
+
+    for length in range(1, 22):
+        tree = consensing.ChainTree(dict((str(i), events[str(i)]) for i in range(length)))
+
+        for otherLength in range(1, 22):
+            prefix = consensing.ChainTree(dict((str(i), events[str(i)]) for i in range(otherLength)))
+            forked = consensing.ChainTree(dict((str(i), other[str(i)]) for i in range(otherLength)))
+
+            assert tree.agreed(prefix) == min(length, otherLength)
+            assert tree.agreed(forked) == min(length, otherLength, 13)
+            assert (tree.root == prefix.root) == (length == otherLength)
+
+
+def testCheckPrefix():
+    consense = consensing.CompositeConsense()
+    builders = [builder.DideryResponseBuilder(builder.CompositeHistoryBuilder().withRotations(rotations))
+                for rotations in (4, 3, 2)]
+
+    data = dict(('http://localhost:{}/event/'.format(8000 + i), response.withPort(8000 + i).build())
+                for i, response in enumerate(builders))
+
+    consense.validateData(data)
+
+    assert consense.checkConsensus(3) is None
+
+    agreed, divergence = consense.checkPrefix(3)
+    exp_data = builders[1].historyBuilder.build()
+
+    assert divergence == 4
+    assert sorted(agreed.keys()) == ["0", "1", "2", "3"]
+    for index, event in agreed.items():
+        assert event == exp_data[index].data
+
+    consense = consensing.CompositeConsense()
+    consense.validateData(dict(list(data.items())[:2]))
+    agreed, divergence = consense.checkPrefix(2)
+
+    assert divergence == 4  # both servers are needed for a majority
+    assert sorted(agreed.keys()) == ["0", "1", "2", "3"]
+
+    consense = consensing.CompositeConsense()
+    consense.validateData(dict([list(data.items())[0]] * 2))
+    agreed, divergence = consense.checkPrefix(1)
+
+    assert divergence is None
+    assert agreed == consense.checkConsensus(1)
+
+    # the divergence is the signer index of the next event, not the number of agreed events
+    events = builder.CompositeHistoryBuilder().withRotations(4).build()
+    shorter = dict((index, events[index]) for index in ("0", "1", "2"))
+    longer = dict(shorter, **{"7": events["3"]})
+    consense = consensing.CompositeConsense()
+    for chain, matches in ((shorter, 2), (longer, 1)):
+        tree = consensing.ChainTree(chain)
+        sha = tree.root.hex()
+        consense.trees[sha] = tree
+        consense.valid_data[sha] = dict((index, event.data) for index, event in chain.items())
+        consense.valid_match_counts[sha] = matches
+
+    agreed, divergence = consense.checkPrefix(3)
+
+    assert sorted(agreed.keys()) == ["0", "1", "2"]
+    assert divergence == 7
+
+
+def signedEvent(did, signer, signers, sks):
+    data = {"id": did, "signer": signer, "signers": signers}
+    bdata = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+    signatures = {"signer": signing.signResource(bdata, sks[0])}
+    if len(sks) > 1:
+        signatures["rotation"] = signing.signResource(bdata, sks[1])
+
+    return responding.HistoryData({"history": data, "signatures": signatures})
+
+
+def signedChain(rotations):
+    keys = [gen.keyGen() for i in range(rotations + 2)]
+    vks = [vk for vk, sk, did in keys]
+    sks = [gen.key64uToKey(sk) for vk, sk, did in keys]
+    did = keys[0][2]
+
+    events = {"0": signedEvent(did, 0, vks[:2], sks[:1])}
+    for signer in range(1, rotations + 1):
+        events[str(signer)] = signedEvent(did, signer, vks[:signer + 2], sks[signer - 1:signer + 1])
+
+    return events, did, vks, sks
+
+
+def testVerifyChain():
+    events, did, vks, sks = signedChain(5)
+
+    assert len(consensing.chainChecks(events)) == 1 + 2 * 5
+    assert consensing.verifyChain(events) is True
+    assert consensing.verifyChain(dict(reversed(list(events.items())))) is True
+
+    known = dict((index, event.data) for index, event in events.items() if index != "5")
+    assert len(consensing.chainChecks(events, known)) == 2
+
+    gap = dict(events)
+    del gap["2"]
+    assert consensing.verifyChain(gap) is False
+
+    # event 3 is correctly signed but replaces the key that event 2 pre-rotated
+    other, otherSk, otherDid = gen.keyGen()
+    broken = dict(events)
+    signers = vks[:3] + [other, vks[4]]
+    broken["3"] = signedEvent(did, 3, signers, [sks[2], gen.key64uToKey(otherSk)])
+    assert broken["3"].valid is True
+    assert consensing.verifyChain(broken) is False
+
+    forged = dict(events)
+    forged["4"] = signedEvent(did, 4, vks[:6], [sks[3], sks[3]])
+    assert consensing.chainChecks(forged) is not None
+    assert consensing.verifyChain(forged) is False
+
+    inception = dict(events)
+    inception["0"] = signedEvent(did, 0, vks[:2], [sks[0], sks[1]])
+    assert consensing.verifyChain(inception) is False
+
+
+def testVerifyChainParallel():
+    events, did, vks, sks = signedChain(20)
+    forged = dict(events)
+    forged["17"] = signedEvent(did, 17, vks[:19], [sks[16], sks[16]])
+    old = verifying.getVerifier()
+    verifying.setVerifier(verifying.ParallelVerifier(workers=4, threshold=8, batch=4))
+
+    try:
+        signing.verdicts.clear()
+        assert consensing.verifyChain(events) is True
+        assert verifying.getVerifier()._pool is not None
+
+        signing.verdicts.clear()
+        assert consensing.verifyChain(forged) is False
+    finally:
+        verifying.setVerifier(old)
+        signing.verdicts.clear()
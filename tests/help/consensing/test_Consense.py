@@ -1,5 +1,22 @@
+import time
+import pytest
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
 from diderypy.help import consensing
+from diderypy.help import helping as h
+from diderypy.help import monitoring
+from diderypy.help import signing
+from diderypy.help import transporting as t
+from diderypy.lib import generating as gen
+from diderypy.lib import historying as hist
+from diderypy.models import responding
+from diderypy.models.consensing import ConsensusResult
 from tests.data import history_data_builder as builder
+from tests.data import serving
 
 
 HISTORY = 0
@@ -317,3 +334,273 @@ def testValidateDataWithTimeOut():
     assert consense.valid_match_counts == {
         history2.signerSig: 1
     }
+
+
+def testConsenseWithTotal():
+    consense = consensing.Consense()
+
+    response1 = builder.DideryResponseBuilder(
+        builder.SignedHistoryBuilder()
+    ).withPort(8000)
+    response2 = builder.DideryResponseBuilder(
+        builder.SignedHistoryBuilder()
+    )
+
+    data = {
+        "http://localhost:8000/history": response1.build(),
+        "http://localhost:8080/history": response2.build()
+    }
+
+    assert consense.consense(data, total=3)[0] == response1.historyBuilder.build().data
+
+    consense = consensing.Consense()
+
+    assert consense.consense(data, total=4)[0] is None
+
+
+def testConsenseEmpty():
+    consense = consensing.Consense()
+
+    with pytest.raises(ValueError) as ex:
+        consense.consense({})
+    assert str(ex.value) == "data cannot be None."
+
+    with pytest.raises(ValueError) as ex:
+        consense.consenseAsync({})
+    assert str(ex.value) == "generators cannot be empty."
+
+    with pytest.raises(ValueError) as ex:
+        consense.consenseSelective([], h.request)
+    assert str(ex.value) == "urls cannot be empty."
+
+
+def testConsenseAsyncDeadline():
+    servers = [serving.FakeServer(latency=0.0 if i == 0 else 1.0).start() for i in range(4)]
+    history, vk, sk, pvk, psk = gen.historyGen()
+    bdata = json.dumps(history, ensure_ascii=False, separators=(",", ":")).encode()
+    record = {"history": history, "signatures": {"signer": signing.signResource(bdata, gen.key64uToKey(sk))}}
+    endpoints = ["{0}/history/{1}".format(server.url, history["id"]) for server in servers]
+
+    for server in servers:
+        server.store(serving.HISTORY, history["id"], record)
+
+    t.setDeadline(0.5)
+    try:
+        consense = consensing.Consense()
+        data, results = consense.consenseAsync(dict((url, h.request(path=url)) for url in endpoints))
+    finally:
+        t.setDeadline(t.DEFAULT_DEADLINE)
+        for server in servers:
+            server.stop()
+
+    # consensus is decided by the second server cut off, the third must still be reported
+    assert data is None
+    assert len(results) == 4
+    assert results[endpoints[0]].validation_status == ConsensusResult.VALID
+    assert [results[url].validation_status for url in endpoints[1:]] == [ConsensusResult.TIMEOUT] * 3
+
+
+def testDecided():
+    consense = consensing.Consense()
+
+    response1 = builder.DideryResponseBuilder(
+        builder.SignedHistoryBuilder()
+    ).withPort(8000)
+    response2 = builder.DideryResponseBuilder(
+        builder.SignedHistoryBuilder()
+    )
+
+    consense.validateResponse(response1.url, response1.build())
+    assert not consense.decided(3)
+
+    consense.validateResponse(response2.url, response2.build())
+    assert consense.decided(3)
+    assert consense.consensus == response1.historyBuilder.build().data
+
+
+def testDecidedImpossibleMajority():
+    consense = consensing.Consense()
+
+    response1 = builder.DideryResponseBuilder(
+        builder.SignedHistoryBuilder()
+    ).withPort(8000)
+    response2 = builder.DideryResponseBuilder(
+        builder.SignedHistoryBuilder().withRotation().withRotation()
+    )
+    response3 = builder.DideryResponseBuilder(
+        builder.SignedHistoryBuilder().withInvalidSignerSignature()
+    ).withPort(8081)
+
+    consense.validateResponse(response1.url, response1.build())
+    consense.validateResponse(response2.url, response2.build())
+    assert not consense.decided(4)
+
+    consense.validateResponse(response3.url, response3.build())
+    assert consense.decided(4)
+    assert consense.consensus is None
+
+
+def testConsenseVerifiesDistinctDataOnce(monkeypatch):
+    calls = []
+    verify = signing.verify
+
+    def countingVerify(signature, message, verkey):
+        calls.append(signature)
+        return verify(signature, message, verkey)
+
+    monkeypatch.setattr(signing, "verify", countingVerify)
+    signing.verdicts.clear()
+
+    consense = consensing.Consense()
+
+    response1 = builder.DideryResponseBuilder(
+        builder.SignedHistoryBuilder().withRotation()
+    )
+    response2 = builder.DideryResponseBuilder(
+        builder.SignedHistoryBuilder().withInvalidSignerSignature()
+    )
+
+    data = {
+        "http://localhost:8000/history": response1.withPort(8000).build(),
+        "http://localhost:8080/history": response1.withPort(8080).build(),
+        "http://localhost:8081/history": response1.withPort(8081).build(),
+        "http://localhost:8001/history": response2.withPort(8001).build(),
+        "http://localhost:8002/history": response2.withPort(8002).build()
+    }
+
+    assert consense.consense(data)[0] is None
+    assert len(calls) == 2  # the valid signature once, the invalid signature once
+    assert consense.valid_match_counts[response1.historyBuilder.rotationSig] == 3
+    assert consense.results["http://localhost:8002/history"].validation_status == 3
+
+
+def testValidateResponseRepeatedBytes(monkeypatch):
+    history, vk, sk, pvk, psk = gen.historyGen()
+    bHistory = json.dumps(history, ensure_ascii=False, separators=(",", ":")).encode()
+    signer = signing.signResource(bHistory, gen.key64uToKey(sk))
+    raw = json.dumps({"history": history, "signatures": {"signer": signer}}).encode()
+    history["changed"] = "forged"
+    forged = json.dumps({"history": history, "signatures": {"signer": signer}}).encode()
+
+    calls = []
+    verify64u = responding.verify64u
+    monkeypatch.setattr(responding, "verify64u", lambda *args: calls.append(args) or verify64u(*args))
+
+    consense = consensing.Consense()
+    for port, body in ((8000, raw), (8001, raw), (8002, forged), (8003, forged), (8004, raw)):
+        url = "http://localhost:{}/history".format(port)
+        consense.validateResponse(url, responding.responseFactory(url, 200, json.loads(body), body))
+
+    assert len(calls) == 2  # each distinct body is verified once
+    assert consense.valid_match_counts == {signer: 3}
+    assert consense.results["http://localhost:8004/history"].validation_status == ConsensusResult.VALID
+    assert consense.results["http://localhost:8003/history"].validation_status == ConsensusResult.FAILED
+    assert "changed" not in consense.valid_data[signer]["history"]
+
+
+def testQuorumSize():
+    assert consensing.quorumSize(1) == 1
+    assert consensing.quorumSize(3) == 2
+    assert consensing.quorumSize(4) == 3
+    assert consensing.quorumSize(6) == 4
+    assert consensing.quorumSize(31) == 21
+
+
+@pytest.fixture
+def selectiveServers():
+    old = monitoring.getMonitor()
+    servers = [serving.FakeServer().start() for i in range(6)]
+    urls = [server.url for server in servers]
+    history, vk, sk, pvk, psk = gen.historyGen()
+    hist.postHistory(history, sk, urls)
+
+    monitor = monitoring.HealthMonitor()  # after the writes so only the latencies below rank the servers
+    monitoring.setMonitor(monitor)
+
+    for i, url in enumerate(urls):  # later servers are slower
+        monitor.record(url, 200, 0.01 * (i + 1))
+
+    yield servers, history
+
+    for server in servers:
+        server.stop()
+    monitoring.setMonitor(old)
+
+
+def testConsenseSelective(selectiveServers):
+    servers, history = selectiveServers
+    endpoints = ["{0}/history/{1}".format(server.url, history["id"]) for server in reversed(servers)]
+    before = [server.requests for server in servers]
+
+    consense = consensing.Consense()
+    data, results = consense.consenseSelective(endpoints, lambda endpoint: h.request(path=endpoint))
+
+    assert data["history"] == history
+    assert len(results) == 4
+    assert [server.requests - count for server, count in zip(servers, before)] == [1, 1, 1, 1, 0, 0]
+
+
+def testConsenseSelectiveEscalates(selectiveServers):
+    servers, history = selectiveServers
+    servers[0].forgeRate = 1.0
+    endpoints = ["{0}/history/{1}".format(server.url, history["id"]) for server in servers]
+
+    consense = consensing.Consense()
+    data, results = consense.consenseSelective(endpoints, lambda endpoint: h.request(path=endpoint))
+
+    assert data["history"] == history
+    assert results[endpoints[0]].validation_status == ConsensusResult.FAILED
+    assert len(results) >= 5
+
+
+def testConsenseSelectiveHedges(selectiveServers):
+    servers, history = selectiveServers
+    monitor = monitoring.getMonitor()
+    endpoints = ["{0}/history/{1}".format(server.url, history["id"]) for server in servers]
+
+    for i in range(monitoring.HEDGE_MIN_SAMPLES):
+        for url in endpoints:
+            monitor.record(url, 200, 0.05)
+
+    servers[0].latency = 1.0  # usually the fastest server stalls
+    before = [server.requests for server in servers]
+
+    consense = consensing.Consense()
+    start = time.monotonic()
+    data, results = consense.consenseSelective(endpoints, lambda endpoint: h.request(path=endpoint))
+
+    assert time.monotonic() - start < 0.9
+    assert data["history"] == history
+    assert monitor.hedges >= 1
+    assert servers[4].requests - before[4] == 1
+
+
+def testConsenseSelectiveDeadline(selectiveServers):
+    servers, history = selectiveServers
+    endpoints = ["{0}/history/{1}".format(server.url, history["id"]) for server in servers]
+
+    for server in servers:
+        server.latency = 1.0
+
+    t.setDeadline(0.3)
+    try:
+        consense = consensing.Consense()
+        start = time.monotonic()
+        data, results = consense.consenseSelective(endpoints, lambda endpoint: h.request(path=endpoint))
+    finally:
+        t.setDeadline(t.DEFAULT_DEADLINE)
+
+    assert time.monotonic() - start < 0.9
+    assert data is None
+    assert len(results) == 4
+    assert all(result.validation_status == ConsensusResult.TIMEOUT for result in results.values())
+
+
+def testGetHistorySelective(selectiveServers):
+    servers, history = selectiveServers
+    urls = [server.url for server in servers]
+
+    data, results = hist.getHistory(history["id"], urls, selective=True)
+
+    assert data["history"] == history
+    assert len(results) == 4
@@ -0,0 +1,179 @@
+import asyncio
+import pytest
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from diderypy.help import caching
+from diderypy.help import helping as h
+from diderypy.help import transporting as t
+from diderypy.lib import historying
+from diderypy.models.consensing import ConsensusResult
+from tests.data import history_data_builder as builder
+
+
+DID = "did:dad:abc"
+
+
+def serveHistory(data, etag='"v1"'):
+    async def handler(reader, writer):
+        head = await reader.readuntil(b"\r\n\r\n")
+        server.requests.append(head)
+
+        if server.down:
+            writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}")
+        elif 'If-None-Match: {}'.format(etag).encode() in head:
+            writer.write('HTTP/1.1 304 Not Modified\r\nETag: {}\r\nConnection: close\r\n\r\n'.format(etag).encode())
+        else:
+            body = json.dumps(data).encode()
+            writer.write('HTTP/1.1 200 OK\r\nETag: {}\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'.format(
+                etag, len(body)).encode() + body)
+        await writer.drain()
+        writer.close()
+
+    server = t.run(asyncio.start_server(handler, "127.0.0.1", 0))
+    server.requests = []
+    server.down = False
+
+    return server, "http://127.0.0.1:{}".format(server.sockets[0].getsockname()[1])
+
+
+@pytest.fixture
+def asyncTransport():
+    t.setTransport(t.ASYNCIO)
+    yield
+    t.setTransport(t.IOFLO)
+
+
+def testInvalidCache():
+    with pytest.raises(ValueError) as ex:
+        caching.ResponseCache(ttl=-1.0)
+
+
+def testStoreAndLoad(tmpdir):
+    path = str(tmpdir.join("cache.db"))
+    data = builder.SignedHistoryBuilder().build().data
+
+    cache = caching.ResponseCache(path)
+    assert cache.load(DID, caching.HISTORY) == (None, None)
+
+    cache.store(DID, caching.HISTORY, data)
+    cache.close()
+
+    cache = caching.ResponseCache(path)
+    assert cache.load(DID, caching.HISTORY)[0] == data
+    assert cache.load(DID, caching.OTP) == (None, None)
+
+    cache.delete(DID, caching.HISTORY)
+    assert cache.load(DID, caching.HISTORY) == (None, None)
+    cache.close()
+
+
+def testFresh():
+    data = builder.SignedHistoryBuilder().build().data
+
+    cache = caching.ResponseCache()
+    cache.store(DID, caching.HISTORY, data)
+    assert cache.fresh(DID, caching.HISTORY) is None  # ttl 0 always revalidates
+
+    cache = caching.ResponseCache(ttl=60.0)
+    cache.store(DID, caching.HISTORY, data)
+    assert cache.fresh(DID, caching.HISTORY) == data
+
+
+def testGetHistoryRevalidates(asyncTransport):
+    data = builder.SignedHistoryBuilder().build().data
+    server1, url1 = serveHistory(data)
+    server2, url2 = serveHistory(data)
+    cache = caching.ResponseCache()
+
+    history, results = historying.getHistory(DID, [url1, url2], cache=cache)
+
+    assert history == data
+    assert b"If-None-Match" not in server1.requests[0]
+
+    history, results = historying.getHistory(DID, [url1, url2], cache=cache)
+
+    assert history == data
+    assert all(result.validation_status == ConsensusResult.VALID for result in results.values())
+    assert b'If-None-Match: "v1"' in server1.requests[1]
+    assert b'If-None-Match: "v1"' in server2.requests[1]
+
+    server1.close()
+    server2.close()
+
+
+def testRequestValidators(asyncTransport):
+    data = builder.SignedHistoryBuilder().build().data
+    server, url = serveHistory(data)
+    cache = caching.ResponseCache()
+    endpoint = url + "/history/" + DID
+    first, second = {}, {}
+
+    async def cancelled():
+        task = asyncio.ensure_future(cache.request(DID, caching.HISTORY, endpoint, second))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    h.awaitAsync({endpoint: cache.request(DID, caching.HISTORY, endpoint, first)})
+    t.run(cancelled())
+
+    assert first == {endpoint: ('"v1"', None)}
+    assert second == {}
+
+    results = {endpoint: ConsensusResult(endpoint, ConsensusResult.VALID, data, 200)}
+    cache.update(DID, caching.HISTORY, data, results, second)
+    assert cache._validator(DID, caching.HISTORY, endpoint) is None
+
+    cache.update(DID, caching.HISTORY, data, results, first)
+    assert cache._validator(DID, caching.HISTORY, endpoint) == ('"v1"', None)
+
+    server.close()
+
+
+def testGetHistoryFresh(asyncTransport):
+    data = builder.SignedHistoryBuilder().build().data
+    server, url = serveHistory(data)
+    cache = caching.ResponseCache(ttl=60.0)
+
+    historying.getHistory(DID, [url], cache=cache)
+    history, results = historying.getHistory(DID, [url], cache=cache)
+
+    assert history == data
+    assert results == {}
+    assert len(server.requests) == 1
+
+    server.close()
+
+
+def testGetHistoryStaleIfError(asyncTransport):
+    data = builder.SignedHistoryBuilder().build().data
+    server, url = serveHistory(data)
+
+    for staleIfError, expected in ((False, None), (True, data)):
+        cache = caching.ResponseCache(staleIfError=staleIfError)
+        server.down = False
+        historying.getHistory(DID, [url], cache=cache)
+
+        server.down = True
+        history, results = historying.getHistory(DID, [url], cache=cache)
+
+        assert history == expected
+        assert results[url + "/history/" + DID].validation_status == ConsensusResult.ERROR
+
+    server.close()
+
+
+def testStaleRejectsConflictingData():
+    data = builder.SignedHistoryBuilder().build().data
+    other = builder.SignedHistoryBuilder().withRotation().build().data
+    cache = caching.ResponseCache(staleIfError=True)
+    cache.store(DID, caching.HISTORY, data)
+
+    url = "http://localhost:8080/history/" + DID
+    results = {url: ConsensusResult(url, ConsensusResult.VALID, other, 200)}
+
+    assert cache.stale(DID, caching.HISTORY, results) is None
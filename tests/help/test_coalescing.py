@@ -0,0 +1,83 @@
+import threading
+import time
+import pytest
+
+from diderypy.help import coalescing
+from diderypy.lib import generating as gen
+from diderypy.lib import historying as hist
+from tests.data import serving
+
+
+def runConcurrently(count, func):
+    results = [None] * count
+    errors = [None] * count
+
+    def target(i):
+        try:
+            results[i] = func()
+        except Exception as ex:
+            errors[i] = ex
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results, errors
+
+
+def testSingleFlightShares():
+    flights = coalescing.SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"history": "shared"}
+
+    results, errors = runConcurrently(5, lambda: flights.do("did", slow))
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flights.flights == {}
+
+
+def testSingleFlightSharesErrors():
+    flights = coalescing.SingleFlight()
+
+    def fail():
+        time.sleep(0.2)
+        raise ValueError("no servers")
+
+    results, errors = runConcurrently(3, lambda: flights.do("did", fail))
+
+    assert all(isinstance(error, ValueError) for error in errors)
+    assert flights.flights == {}
+
+
+def testSingleFlightSequential():
+    flights = coalescing.SingleFlight()
+    calls = []
+
+    flights.do("did", calls.append, 1)
+    flights.do("did", calls.append, 2)
+
+    assert calls == [1, 2]
+
+
+def testGetHistoryCoalesced():
+    servers = [serving.FakeServer(latency=0.2).start() for i in range(3)]
+    urls = [server.url for server in servers]
+    history, vk, sk, pvk, psk = gen.historyGen()
+    hist.postHistory(history, sk, urls)
+
+    before = sum(server.requests for server in servers)
+    results, errors = runConcurrently(5, lambda: hist.getHistory(history["id"], urls))
+
+    assert errors == [None] * 5
+    assert all(result[0]["history"] == history for result in results)
+    assert sum(server.requests for server in servers) - before == len(servers)
+
+    for server in servers:
+        server.stop()
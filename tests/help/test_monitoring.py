@@ -0,0 +1,230 @@
+import socket
+import time
+import pytest
+
+from diderypy.help import monitoring as m
+from diderypy.help import transporting as t
+from diderypy.lib import generating as gen
+from diderypy.lib import historying as hist
+from diderypy.models.consensing import ConsensusResult
+from tests.data import serving
+
+
+def deadUrl():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    return "http://127.0.0.1:{}".format(port)
+
+
+@pytest.fixture
+def monitor():
+    old = m.getMonitor()
+    monitor = m.HealthMonitor(threshold=2, cooldown=60.0)
+    m.setMonitor(monitor)
+    t.setTimeout(0.5)  # the ioflo transport retries refused connections until it times out
+    yield monitor
+    t.setTimeout(t.DEFAULT_TIMEOUT)
+    m.setMonitor(old)
+
+
+def testInvalidHealthMonitor():
+    with pytest.raises(ValueError) as ex:
+        m.HealthMonitor(threshold=-1)
+
+    with pytest.raises(ValueError) as ex:
+        m.HealthMonitor(cooldown=10.0, maxCooldown=5.0)
+
+    with pytest.raises(ValueError) as ex:
+        m.HealthMonitor(alpha=0.0)
+
+
+def testServerKey():
+    assert m.serverKey("http://localhost:8080/history/did:dad:abc") == "http://localhost:8080"
+
+
+def testRecord():
+    monitor = m.HealthMonitor(threshold=2)
+    url = "http://localhost:8080/history/did:dad:abc"
+
+    monitor.record(url, 0)
+    assert monitor.allow(url)
+
+    monitor.record(url, 503)
+    health = monitor.health(url)
+    assert health.state == m.OPEN
+    assert health.consecutiveFailures == 2
+    assert not monitor.allow(url)
+
+    monitor.record(url, 404)  # a server that answers is alive
+    assert health.state == m.CLOSED
+    assert health.consecutiveFailures == 0
+    assert health.lastSuccess is not None
+    assert 0.0 < health.errorRate < 1.0
+    assert monitor.allow(url)
+
+
+def testProbe():
+    monitor = m.HealthMonitor(threshold=1, cooldown=1.0, maxCooldown=3.0)
+    dead = deadUrl()
+
+    monitor.record(dead, 0)
+    assert not monitor.probe(dead)
+    assert monitor.health(dead).state == m.OPEN
+    assert monitor.health(dead).cooldown == 2.0
+
+    assert not monitor.probe(dead)
+    assert monitor.health(dead).cooldown == 3.0
+
+    with serving.FakeServer() as server:
+        monitor.record(server.url, 0)
+        assert monitor.probe(server.url)
+        assert monitor.health(server.url).state == m.CLOSED
+        assert monitor.health(server.url).cooldown == 1.0
+
+
+def testBackgroundProbe():
+    monitor = m.HealthMonitor(threshold=1, cooldown=0.0)
+
+    with serving.FakeServer() as server:
+        monitor.record(server.url, 0)
+        assert not monitor.allow(server.url)  # starts the probe
+
+        for i in range(100):
+            if monitor.health(server.url).state == m.CLOSED:
+                break
+            time.sleep(0.01)
+
+        assert monitor.allow(server.url)
+
+
+def testOpenCircuitSkipsServer(monitor):
+    servers = [serving.FakeServer().start() for i in range(2)]
+    urls = [server.url for server in servers] + [deadUrl()]
+    history, vk, sk, pvk, psk = gen.historyGen()
+    hist.postHistory(history, sk, urls)
+
+    hist.getHistory(history["id"], urls)
+    assert monitor.health(urls[2]).state == m.OPEN
+
+    failures = monitor.health(urls[2]).failures
+    data, results = hist.getHistory(history["id"], urls)
+
+    assert data["history"] == history
+    assert monitor.health(urls[2]).failures == failures  # not contacted
+    assert results[urls[2] + "/history/" + history["id"]].validation_status == ConsensusResult.TIMEOUT
+
+    servers[1].stop()
+    hist.getHistory(history["id"], urls)
+    hist.getHistory(history["id"], urls)
+    assert monitor.health(urls[1]).state == m.OPEN
+
+    data, results = hist.getHistory(history["id"], urls)
+
+    assert data is None  # one server out of three configured is not a majority
+
+    servers[0].stop()
+
+
+def testOpenCircuitSendsWrites(monitor):
+    servers = [serving.FakeServer().start() for i in range(3)]
+    urls = [server.url for server in servers]
+    history, vk, sk, pvk, psk = gen.historyGen()
+    nvk, nsk, ndid = gen.keyGen()
+    hist.postHistory(history, sk, urls)
+
+    servers[2].errorRate = 1.0
+    hist.getHistory(history["id"], urls)
+    hist.getHistory(history["id"], urls)
+    assert monitor.health(urls[2]).state == m.OPEN
+
+    servers[2].errorRate = 0.0
+    requests = servers[2].requests
+    history["signer"] = 1
+    history["signers"].append(nvk)
+    results = hist.putHistory(history, sk, psk, urls)
+
+    assert servers[2].requests == requests + 1
+    assert results[urls[2] + "/history/" + history["id"]].status == 200
+    assert servers[2].history[history["id"]]["history"]["signer"] == 1
+
+    for server in servers:
+        server.stop()
+
+
+def testConfigure():
+    old = m.getMonitor()
+
+    try:
+        m.configure({"servers": []})
+        assert m.getMonitor().threshold == 0  # never opens a circuit
+
+        m.configure({"servers": [], "breaker": {}})
+        assert m.getMonitor().threshold == m.DEFAULT_THRESHOLD
+
+        m.configure({"servers": [], "breaker": {"threshold": 5, "cooldown": 10.0}})
+        assert m.getMonitor().threshold == 5
+        assert m.getMonitor().cooldown == 10.0
+    finally:
+        m.setMonitor(old)
+
+
+def testRank():
+    monitor = m.HealthMonitor(threshold=1, alpha=0.5)
+    fast, slow, new, dead = ("http://localhost:{}/history".format(port) for port in (8000, 8001, 8002, 8003))
+
+    monitor.record(fast, 200, 0.1)
+    monitor.record(slow, 200, 0.1)
+    monitor.record(slow, 200, 0.5)
+    monitor.record(dead, 0, 0.01)
+
+    assert monitor.health(slow).latency == pytest.approx(0.3)
+    assert monitor.rank([dead, slow, fast, new]) == [new, fast, slow, dead]
+
+
+def testInvalidHedge():
+    with pytest.raises(ValueError):
+        m.HealthMonitor(hedgePercentile=0)
+
+    with pytest.raises(ValueError):
+        m.HealthMonitor(hedgePercentile=101)
+
+    with pytest.raises(ValueError):
+        m.HealthMonitor(hedgeBudget=-0.1)
+
+
+def testHedgeDelay():
+    monitor = m.HealthMonitor(hedgePercentile=90.0)
+    url = "http://localhost:8000/history"
+
+    for i in range(m.HEDGE_MIN_SAMPLES - 1):
+        monitor.record(url, 200, 0.01)
+
+    assert monitor.hedgeDelay(url) is None  # too few samples
+
+    for elapsed in range(1, 11):
+        monitor.record(url, 200, elapsed / 10.0)
+    monitor.record(url, 500, 5.0)  # failures are not latency samples
+
+    assert len(monitor.health(url).latencies) == 14
+    assert monitor.hedgeDelay(url) == pytest.approx(0.9)
+
+    monitor.hedgePercentile = None
+
+    assert monitor.hedgeDelay(url) is None
+
+
+def testSpendHedge():
+    monitor = m.HealthMonitor(hedgeBudget=0.1)
+
+    assert not monitor.spendHedge()
+
+    for i in range(20):
+        monitor.record("http://localhost:8000/history", 200, 0.01)
+
+    assert monitor.spendHedge()
+    assert monitor.spendHedge()
+    assert not monitor.spendHedge()
+    assert monitor.hedges == 2
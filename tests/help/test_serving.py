@@ -0,0 +1,119 @@
+import pytest
+
+from diderypy.help import transporting as t
+from diderypy.lib import generating as gen
+from diderypy.lib import historying as hist
+from diderypy.lib import history_eventing as events
+from diderypy.lib import otping as otp
+from diderypy.models.consensing import ConsensusResult
+from tests.data import serving
+
+
+@pytest.fixture
+def servers():
+    servers = [serving.FakeServer(seed=i).start() for i in range(3)]
+    yield servers
+    for server in servers:
+        server.stop()
+
+
+def postRotation(urls):
+    history, vk, sk, pvk, psk = gen.historyGen()
+    hist.postHistory(history, sk, urls)
+
+    npvk, npsk, ndid = gen.keyGen()
+    history["signers"].append(npvk)
+    history["signer"] = 1
+    hist.putHistory(history, sk, psk, urls)
+
+    return history, psk
+
+
+def testInvalidFakeServer():
+    with pytest.raises(ValueError) as ex:
+        serving.FakeServer(errorRate=1.5)
+
+    with pytest.raises(ValueError) as ex:
+        serving.FakeServer(latency=-1.0)
+
+
+def testParseSignatures():
+    assert serving.parseSignatures('signer="abc"; rotation="def"') == {"signer": "abc", "rotation": "def"}
+    assert serving.parseSignatures(None) == {}
+
+
+def testHistoryEndToEnd(servers):
+    urls = [server.url for server in servers]
+    history, sk = postRotation(urls)
+
+    data, results = hist.getHistory(history["id"], urls)
+
+    assert data["history"] == history
+    assert all(result.validation_status == ConsensusResult.VALID for result in results.values())
+
+    data, results = events.getHistoryEvents(history["id"], urls)
+
+    assert list(data["events"].keys()) == ["0", "1"]
+    assert data["events"]["1"]["history"] == history
+
+    responses = hist.deleteHistory(history["id"], sk, urls)
+
+    assert all(response.status == 200 for response in responses.values())
+    assert all(server.history == {} for server in servers)
+
+
+def testOtpBlobEndToEnd(servers):
+    urls = [server.url for server in servers]
+    history, vk, sk, pvk, psk = gen.historyGen()
+    blob = {"id": history["id"], "blob": "AeYbsHot0pmdWAcgTo5sD8iAuSQAfnH5U6wiIGpVNJQQoYKBYrPPxAoIc1i5SHCIDS8KFFgf8i0tDq8XGizaCgo9yjuKHHNJZFi0QD9K6Vpt6fP0XgXlj8z_4D-7s3CcYmuoWAh6NVtYaf_GWw_2sCrHBAA2mAEsml3thLmu50Dw"}
+
+    responses = otp.postOtpBlob(blob, sk, urls)
+
+    assert all(response.status == 201 for response in responses.values())
+
+    data, results = otp.getOtpBlob(history["id"], urls)
+
+    assert data["otp_data"] == blob
+
+
+def testFaults(servers):
+    urls = [server.url for server in servers]
+    history, sk = postRotation(urls)
+
+    servers[0].forgeRate = 1.0
+    servers[1].errorRate = 1.0
+
+    data, results = hist.getHistory(history["id"], urls)
+
+    assert data is None
+    assert results[urls[0] + "/history/" + history["id"]].validation_status == ConsensusResult.FAILED
+    assert results[urls[1] + "/history/" + history["id"]].http_status == 500
+    assert results[urls[2] + "/history/" + history["id"]].validation_status == ConsensusResult.VALID
+
+
+def testTimeoutRate(servers):
+    urls = [server.url for server in servers]
+    history, sk = postRotation(urls)
+    servers[0].timeoutRate = 1.0
+    t.setTimeout(0.2)
+
+    try:
+        data, results = hist.getHistory(history["id"], urls)
+    finally:
+        t.setTimeout(t.DEFAULT_TIMEOUT)
+
+    assert data["history"] == history
+    assert results[urls[0] + "/history/" + history["id"]].validation_status == ConsensusResult.TIMEOUT
+
+
+def testDivergentData(servers):
+    urls = [server.url for server in servers]
+    history, sk = postRotation(urls)
+    other, osk = postRotation(urls)
+
+    servers[0].store(serving.HISTORY, history["id"], servers[0].history[other["id"]])
+    servers[1].store(serving.HISTORY, history["id"], servers[1].history[other["id"]])
+
+    data, results = hist.getHistory(history["id"], urls)
+
+    assert data["history"] == other
@@ -0,0 +1,104 @@
+import libnacl
+
+from diderypy.help import signing
+from diderypy.lib import generating as gen
+
+
+vk, sk = libnacl.crypto_sign_keypair()
+msg = b'{"id":"did:dad:abc","signer":0}' * 100
+
+
+def testSignResource():
+    signature = signing.signResource(msg, sk)
+
+    # detached signature matches the first 64 bytes of an attached signature
+    assert gen.key64uToKey(signature) == libnacl.crypto_sign(msg, sk)[:libnacl.crypto_sign_BYTES]
+    assert signing.signResource(memoryview(msg), sk) == signature
+    assert signing.signResource(bytearray(msg), sk) == signature
+    assert signing.signResource(None, sk) is None
+
+
+def testVerify():
+    sig = gen.key64uToKey(signing.signResource(msg, sk))
+
+    assert signing.verify(sig, msg, vk) is True
+    assert signing.verify(sig, memoryview(msg), vk) is True
+    assert signing.verify(sig, bytearray(msg), vk) is True
+    assert signing.verify(sig, memoryview(b"xx" + msg)[2:], vk) is True
+
+
+def testVerifyInvalid():
+    sig = gen.key64uToKey(signing.signResource(msg, sk))
+    otherVk, otherSk = libnacl.crypto_sign_keypair()
+
+    assert signing.verify(sig, msg + b" ", vk) is False
+    assert signing.verify(sig, msg, otherVk) is False
+    assert signing.verify(sig[:-1], msg, vk) is False
+    assert signing.verify(sig, msg, vk[:-1]) is False
+
+
+def testVerify64u():
+    signature = signing.signResource(msg, sk)
+
+    assert signing.verify64u(signature, msg, gen.keyToKey64u(vk)) is True
+    assert signing.verify64u(signature, msg[1:], gen.keyToKey64u(vk)) is False
+
+
+def testLRUCache():
+    cache = signing.LRUCache(2)
+
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # a is now most recently used
+    cache.put("c", 3)
+
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert cache.hits == 2
+    assert cache.misses == 1
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.hits == 0
+    assert cache.misses == 0
+
+
+def testLRUCacheDisabled():
+    cache = signing.LRUCache(0)
+    cache.put("a", 1)
+
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def testVerify64uCachesVerdicts(monkeypatch):
+    calls = []
+    verify = signing.verify
+
+    def countingVerify(sig, msg, vk):
+        calls.append(sig)
+        return verify(sig, msg, vk)
+
+    monkeypatch.setattr(signing, "verify", countingVerify)
+    signing.verdicts.clear()
+    signing.verkeys.clear()
+
+    signature = signing.signResource(msg, sk)
+    verkey = gen.keyToKey64u(vk)
+
+    assert signing.verify64u(signature, msg, verkey) is True
+    assert signing.verify64u(signature, msg, verkey) is True
+    assert signing.verify64u(signature, msg + b" ", verkey) is False
+    assert signing.verify64u(signature, msg + b" ", verkey) is False
+
+    assert len(calls) == 2
+    assert signing.verdicts.hits == 2
+    assert signing.verdicts.misses == 2
+    assert signing.verkeys.hits == 1
+    assert signing.verkeys.misses == 1
+
+
+def testVerify64uNoneValues():
+    assert signing.verify64u(None, msg, gen.keyToKey64u(vk)) is False
+    assert signing.verify64u(signing.signResource(msg, sk), msg, None) is False
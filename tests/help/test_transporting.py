@@ -0,0 +1,450 @@
+import asyncio
+import threading
+import time
+import pytest
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from diderypy.help import helping as h
+from diderypy.help import transporting as t
+from tests.data import serving
+
+
+async def serve(status, body, chunked=False):
+    async def handler(reader, writer):
+        head = await reader.readuntil(b"\r\n\r\n")
+        length = 0
+        for line in head.split(b"\r\n"):
+            if line.lower().startswith(b"content-length"):
+                length = int(line.split(b":")[1])
+        request = await reader.readexactly(length)
+        server.requests.append((head, request))
+
+        if chunked:
+            writer.write("HTTP/1.1 {} OK\r\nTransfer-Encoding: chunked\r\n\r\n".format(status).encode())
+            writer.write("{:x}\r\n".format(len(body)).encode() + body + b"\r\n0\r\n\r\n")
+        else:
+            writer.write("HTTP/1.1 {} OK\r\nContent-Length: {}\r\n\r\n".format(status, len(body)).encode() + body)
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handler, "127.0.0.1", 0)
+    server.requests = []
+
+    return server, "http://127.0.0.1:{}".format(server.sockets[0].getsockname()[1])
+
+
+def testSetTransport():
+    assert t.getTransport() == t.IOFLO
+
+    t.setTransport(t.ASYNCIO)
+    assert t.getTransport() == t.ASYNCIO
+
+    t.setTransport(t.IOFLO)
+    assert t.getTransport() == t.IOFLO
+
+
+def testSetInvalidTransport():
+    with pytest.raises(ValueError) as ex:
+        t.setTransport("carrier pigeon")
+
+
+def testAsyncRequest():
+    server, url = t.run(serve(200, b'{"id":"did:dad:abc"}'))
+
+    response = t.run(t.asyncRequest(path=url + "/history/did:dad:abc"))
+
+    assert response["status"] == 200
+    assert response["body"] == b'{"id":"did:dad:abc"}'
+    assert server.requests[0][0].startswith(b"GET /history/did%3Adad%3Aabc HTTP/1.1\r\n")
+
+    server.close()
+
+
+def testAsyncRequestChunked():
+    server, url = t.run(serve(201, b'{"id":"did:dad:abc"}', chunked=True))
+
+    response = t.run(t.asyncRequest("POST", path=url + "/history", data={"id": "did:dad:abc"}))
+
+    assert response["status"] == 201
+    assert response["body"] == b'{"id":"did:dad:abc"}'
+    assert server.requests[0][1] == b'{"id":"did:dad:abc"}'
+
+    server.close()
+
+
+def testAsyncRequestConnectionRefused():
+    server, url = t.run(serve(200, b''))
+    server.close()
+    t.run(server.wait_closed())
+
+    assert t.run(t.asyncRequest(path=url + "/history")) is None
+
+
+def testAwaitAsyncMixedTransports():
+    server, url = t.run(serve(404, json.dumps({"title": "404 Not Found"}).encode()))
+
+    generators = {
+        "ioflo": h.httpRequest(path=url + "/history"),
+        "asyncio": t.asyncRequest(path=url + "/history")
+    }
+
+    values = h.awaitAsync(generators)
+
+    assert values["ioflo"].status == 404
+    assert values["ioflo"].response.data == {"title": "404 Not Found"}
+    assert values["asyncio"].status == 404
+    assert values["asyncio"].response.data == {"title": "404 Not Found"}
+    assert values["ioflo"].raw == values["asyncio"].raw == json.dumps({"title": "404 Not Found"}).encode()
+    assert type(values["ioflo"].raw) is bytes
+
+    server.close()
+
+
+def testConnectionReuse():
+    connections = []
+
+    async def keepAlive(reader, writer):
+        connections.append(writer)
+        while True:
+            try:
+                await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}")
+            await writer.drain()
+
+    server = t.run(asyncio.start_server(keepAlive, "127.0.0.1", 0))
+    url = "http://127.0.0.1:{}".format(server.sockets[0].getsockname()[1])
+    t.setPool(t.ConnectionPool(maxPerHost=2))
+
+    for i in range(3):
+        response = t.run(t.asyncRequest(path=url + "/history"))
+        assert response["status"] == 200
+
+    assert len(connections) == 1
+    assert t.getPool().size == 1
+
+    t.getPool().idleTimeout = 0.0
+    t.getPool().evict()
+    assert t.getPool().size == 0
+
+    t.setPool(t.ConnectionPool())
+    server.close()
+
+
+def testConnectionRetry():
+    requests = []
+
+    async def answerOnce(reader, writer):
+        # answers the first request on a connection and drops the connection
+        # after reading the second one, as if it had timed out while idle
+        for i in range(2):
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except asyncio.IncompleteReadError:
+                break
+            requests.append(head.split(b" ")[0])
+            if i == 0:
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}")
+                await writer.drain()
+        writer.close()
+
+    server = t.run(asyncio.start_server(answerOnce, "127.0.0.1", 0))
+    url = "http://127.0.0.1:{}".format(server.sockets[0].getsockname()[1])
+    t.setPool(t.ConnectionPool(maxPerHost=2))
+
+    assert t.run(t.asyncRequest(path=url + "/history"))["status"] == 200
+    assert t.run(t.asyncRequest(path=url + "/history"))["status"] == 200  # retried on a new connection
+    assert requests == [b"GET", b"GET", b"GET"]
+
+    # the server may have applied a write it did not answer so it is not sent again
+    assert t.run(t.asyncRequest(method="PUT", path=url + "/history", data={})) is None
+    assert requests == [b"GET", b"GET", b"GET", b"PUT"]
+
+    t.setPool(t.ConnectionPool())
+    server.close()
+
+
+def testConnectionPoolDisabled():
+    server, url = t.run(serve(200, b'{}'))
+    t.setPool(t.ConnectionPool(maxPerHost=0))
+
+    response = t.run(t.asyncRequest(path=url + "/history"))
+
+    assert response["status"] == 200
+    assert t.getPool().size == 0
+
+    t.setPool(t.ConnectionPool())
+    server.close()
+
+
+def testInvalidConnectionPool():
+    with pytest.raises(ValueError) as ex:
+        t.ConnectionPool(maxPerHost=-1)
+
+    with pytest.raises(ValueError) as ex:
+        t.ConnectionPool(idleTimeout=-1.0)
+
+
+def testPoolLimits():
+    with pytest.raises(ValueError) as ex:
+        t.setPoolLimits(maxPerHost=-1)
+
+    pools = []
+
+    try:
+        t.configure({"servers": [], "pool": {"max_per_host": 0, "idle_timeout": 5.0}})
+        assert t.getPoolLimits() == (0, 5.0)
+
+        # threads other than the one that read the config use the same limits
+        thread = threading.Thread(target=lambda: pools.append(t.getPool()))
+        thread.start()
+        thread.join()
+
+        assert pools[0].maxPerHost == 0
+        assert pools[0].idleTimeout == 5.0
+        assert t.getPool().maxPerHost == 0
+    finally:
+        t.configure({"servers": []})
+
+    assert t.getPool().maxPerHost == t.DEFAULT_MAX_PER_HOST
+
+
+def testRunInsideLoop():
+    outer = t.getPool()
+
+    async def inside(url):
+        assert t.getPool() is not outer  # connections belong to the loop they were opened on
+        response = t.run(t.asyncRequest(path=url + "/history"))  # runs on the worker loop
+        t.getPool().close()
+
+        return response
+
+    with serving.FakeServer() as server:
+        loop = asyncio.new_event_loop()
+
+        try:
+            response = loop.run_until_complete(inside(server.url))
+        finally:
+            loop.close()
+
+    assert response["status"] == 404
+
+
+def testAwaitAsyncUntil():
+    fast, fastUrl = t.run(serve(404, b'{"title": "404 Not Found"}'))
+
+    async def stall(reader, writer):
+        await reader.read()  # never respond, wait for the client to hang up
+
+    slow = t.run(asyncio.start_server(stall, "127.0.0.1", 0))
+    slowUrl = "http://127.0.0.1:{}".format(slow.sockets[0].getsockname()[1])
+
+    generators = {
+        "fast": t.asyncRequest(path=fastUrl + "/history"),
+        "slow": t.asyncRequest(path=slowUrl + "/history")
+    }
+
+    values = h.awaitAsync(generators, until=lambda url, response: response.status == 404)
+
+    assert list(values.keys()) == ["fast"]
+
+    fast.close()
+    slow.close()
+
+
+def testSetTimeouts():
+    with pytest.raises(ValueError) as ex:
+        t.setTimeout(0)
+
+    with pytest.raises(ValueError) as ex:
+        t.setDeadline(-1.0)
+
+    t.setTimeout(2.5)
+    t.setDeadline(5.0)
+    assert t.getTimeout() == 2.5
+    assert t.getDeadline() == 5.0
+
+    t.setTimeout(t.DEFAULT_TIMEOUT)
+    t.setDeadline(t.DEFAULT_DEADLINE)
+
+
+def testRequestTimeout():
+    async def stall(reader, writer):
+        await reader.read()  # never respond, wait for the client to hang up
+
+    server = t.run(asyncio.start_server(stall, "127.0.0.1", 0))
+    url = "http://127.0.0.1:{}".format(server.sockets[0].getsockname()[1])
+
+    generators = {
+        "ioflo": h.httpRequest(path=url + "/history", timeout=0.2),
+        "asyncio": t.asyncRequest(path=url + "/history", timeout=0.2)
+    }
+
+    start = time.monotonic()
+    values = h.awaitAsync(generators)
+
+    assert 0.2 <= time.monotonic() - start < 2.0
+    assert values["ioflo"].status == 0
+    assert values["asyncio"].status == 0
+
+    server.close()
+
+
+def testAwaitAsyncDeadline():
+    fast, fastUrl = t.run(serve(404, b'{"title": "404 Not Found"}'))
+
+    async def stall(reader, writer):
+        await reader.read()  # never respond, wait for the client to hang up
+
+    slow = t.run(asyncio.start_server(stall, "127.0.0.1", 0))
+    slowUrl = "http://127.0.0.1:{}".format(slow.sockets[0].getsockname()[1])
+
+    generators = {
+        "fast": t.asyncRequest(path=fastUrl + "/history"),
+        "slow": t.asyncRequest(path=slowUrl + "/history")
+    }
+
+    start = time.monotonic()
+    values = h.awaitAsync(generators, deadline=0.2)
+
+    assert time.monotonic() - start < 2.0
+    assert values["fast"].status == 404
+    assert values["slow"].status == 0
+
+    fast.close()
+    slow.close()
+
+
+def testAwaitAsyncLimit():
+    active = []
+    peak = []
+
+    async def handler(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        active.append(writer)
+        peak.append(len(active))
+        await asyncio.sleep(0.01)
+        active.remove(writer)
+        writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}")
+        await writer.drain()
+        writer.close()
+
+    server = t.run(asyncio.start_server(handler, "127.0.0.1", 0))
+    url = "http://127.0.0.1:{}".format(server.sockets[0].getsockname()[1])
+
+    generators = {}
+    for i in range(10):
+        generators[str(i)] = t.asyncRequest(path="{}/history/{}".format(url, i))
+
+    values = h.awaitAsync(generators, limit=3)
+
+    assert list(values.keys()) == [str(i) for i in range(10)]
+    assert all(value.status == 404 for value in values.values())
+    assert max(peak) <= 3
+
+    server.close()
+
+
+def testInvalidRequestLimiter():
+    with pytest.raises(ValueError):
+        t.RequestLimiter(total=0)
+
+    with pytest.raises(ValueError):
+        t.RequestLimiter(perHost=-1)
+
+    with pytest.raises(ValueError):
+        t.RequestLimiter(total=2.5)
+
+
+def testRequestLimiterPerHost():
+    active = {}
+    peak = {}
+
+    async def handler(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        port = writer.get_extra_info("sockname")[1]
+        active[port] = active.get(port, 0) + 1
+        peak[port] = max(peak.get(port, 0), active[port])
+        await asyncio.sleep(0.01)
+        active[port] -= 1
+        writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}")
+        await writer.drain()
+        writer.close()
+
+    servers = [t.run(asyncio.start_server(handler, "127.0.0.1", 0)) for i in range(2)]
+    urls = ["http://127.0.0.1:{}".format(server.sockets[0].getsockname()[1]) for server in servers]
+    old = t.getLimiter()
+    limiter = t.RequestLimiter(total=3, perHost=2)
+    t.setLimiter(limiter)
+
+    try:
+        generators = {}
+        for i in range(12):
+            path = "{}/history/{}".format(urls[i % 2], i)
+            generators[path] = t.asyncRequest(path=path)
+
+        values = h.awaitAsync(generators)
+    finally:
+        t.setLimiter(old)
+        for server in servers:
+            server.close()
+
+    assert all(value.status == 404 for value in values.values())
+    assert max(peak.values()) <= 2
+    assert limiter.active == 0
+    assert limiter.hosts == {}
+
+
+def testRequestLimiterFairQueue():
+    limiter = t.RequestLimiter(total=1, perHost=None)
+    order = []
+
+    async def request(name, flow):
+        await limiter.acquire("http://127.0.0.1:8000", flow)
+        order.append(name)
+        await asyncio.sleep(0)
+        limiter.release("http://127.0.0.1:8000")
+
+    async def fanOut():
+        await limiter.acquire("http://127.0.0.1:8000", "first")
+        batch = [asyncio.ensure_future(request("batch{}".format(i), "batch")) for i in range(4)]
+        await asyncio.sleep(0)
+        single = asyncio.ensure_future(request("single", "interactive"))
+        await asyncio.sleep(0)
+
+        assert limiter.waiting == 5
+
+        limiter.release("http://127.0.0.1:8000")
+        await asyncio.gather(single, *batch)
+
+    t.run(fanOut())
+
+    assert order == ["batch0", "single", "batch1", "batch2", "batch3"]
+    assert limiter.active == 0
+
+
+def testRequestLimiterCancelled():
+    limiter = t.RequestLimiter(total=1)
+
+    async def cancel():
+        await limiter.acquire("http://127.0.0.1:8000")
+        waiter = asyncio.ensure_future(limiter.acquire("http://127.0.0.1:8001"))
+        await asyncio.sleep(0)
+
+        assert limiter.waiting == 1
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        assert limiter.waiting == 0
+
+        limiter.release("http://127.0.0.1:8000")
+
+    t.run(cancel())
+
+    assert limiter.active == 0
@@ -0,0 +1,112 @@
+import pytest
+
+from diderypy.help import signing
+from diderypy.help import verifying as v
+from diderypy.lib import generating as gen
+
+
+def signedChecks(count):
+    vk, sk, did = gen.keyGen()
+    sk = gen.key64uToKey(sk)
+    checks = []
+
+    for i in range(count):
+        message = "message {}".format(i).encode()
+        checks.append((signing.signResource(message, sk), message, vk))
+
+    return checks
+
+
+@pytest.fixture
+def verifier():
+    verifier = v.ParallelVerifier(workers=4, threshold=8, batch=4)
+    yield verifier
+    verifier.close()
+    signing.verdicts.clear()
+
+
+def testInvalidParallelVerifier():
+    with pytest.raises(ValueError) as ex:
+        v.ParallelVerifier(workers=0)
+
+    with pytest.raises(ValueError) as ex:
+        v.ParallelVerifier(threshold=-1)
+
+    with pytest.raises(ValueError) as ex:
+        v.ParallelVerifier(batch=0)
+
+    with pytest.raises(ValueError) as ex:
+        v.ParallelVerifier(executor="fiber")
+
+
+def testVerifyBatch():
+    checks = signedChecks(3)
+    signature, message, verkey = checks[1]
+    checks[1] = (signature, b"forged", verkey)
+
+    assert v.verifyBatch(checks) == [True, False, True]
+
+
+def testVerifyInline(verifier):
+    signing.verdicts.clear()
+    checks = signedChecks(7)
+
+    assert verifier.verify(checks) is True
+    assert verifier._pool is None  # below threshold
+    assert len(signing.verdicts) == 7
+
+
+def testVerifyParallel(verifier):
+    signing.verdicts.clear()
+    checks = signedChecks(30)
+
+    assert verifier.verify(checks) is True
+    assert verifier._pool is not None
+    assert len(signing.verdicts) == 30
+
+    # cached verdicts are not handed to the pool again
+    verifier.close()
+    assert verifier.verify(checks) is True
+    assert verifier._pool is None
+
+    signature, message, verkey = checks[20]
+    checks[20] = (signature, b"forged", verkey)
+    assert verifier.verify(checks) is False
+
+    checks[20] = (None, message, verkey)
+    assert verifier.verify(checks) is False
+
+
+def testVerifyProcessPool():
+    signing.verdicts.clear()
+    verifier = v.ParallelVerifier(workers=2, threshold=4, batch=4, executor=v.PROCESS)
+    checks = signedChecks(12)
+
+    try:
+        assert verifier.verify(checks) is True
+        assert len(signing.verdicts) == 12
+
+        signing.verdicts.clear()
+        signature, message, verkey = checks[0]
+        checks[0] = (signature, b"forged", verkey)
+        assert verifier.verify(checks) is False
+    finally:
+        verifier.close()
+        signing.verdicts.clear()
+
+
+def testConfigure():
+    old = v.getVerifier()
+
+    try:
+        v.configure({"servers": []})
+        assert v.getVerifier() is None
+
+        v.configure({"servers": [], "verify": {"workers": 2, "threshold": 100, "batch": 10}})
+        verifier = v.getVerifier()
+        assert verifier.workers == 2
+        assert verifier.threshold == 100
+        assert verifier.batch == 10
+        assert verifier.executor == v.THREAD
+    finally:
+        v.setVerifier(old)
@@ -1,8 +1,11 @@
+import asyncio
 import pytest
 
+from diderypy.help import signing
 from diderypy.lib import history_eventing as event
 from diderypy.lib import generating as gen
 from diderypy.lib import historying as hist
+from tests.data import serving
 
 
 history, vk1, sk1, vk2, sk2 = gen.historyGen()
@@ -48,3 +51,107 @@ def testGetHistoryEventsNoUrls():
 def testGetHistoryEventsEmptyUrls():
     with pytest.raises(ValueError) as ex:
         event.getHistoryEvents(did, [])
+
+
+def testAwaitHistoryEvents():
+    servers = [serving.FakeServer().start() for i in range(3)]
+    fakeUrls = [server.url for server in servers]
+
+    try:
+        data, vk, sk, pvk, psk = gen.historyGen()
+        hist.postHistory(data, sk, fakeUrls)
+        loop = asyncio.new_event_loop()
+
+        try:
+            events, results = loop.run_until_complete(event.awaitHistoryEvents(data["id"], fakeUrls))
+        finally:
+            loop.close()
+
+        assert events["events"]["0"]["history"] == data
+    finally:
+        for server in servers:
+            server.stop()
+
+
+def testGetHistoryEventsKnown(monkeypatch):
+    servers = [serving.FakeServer().start() for i in range(3)]
+    fakeUrls = [server.url for server in servers]
+
+    try:
+        data, vk, sk, pvk, psk = gen.historyGen()
+        hist.postHistory(data, sk, fakeUrls)
+        for i in range(3):
+            nvk, nsk, ndid = gen.keyGen()
+            data["signer"] += 1
+            data["signers"].append(nvk)
+            hist.putHistory(data, sk, psk, fakeUrls)
+            sk, psk = psk, nsk
+
+        events, results = event.getHistoryEvents(data["id"], fakeUrls)
+
+        nvk, nsk, ndid = gen.keyGen()
+        data["signer"] += 1
+        data["signers"].append(nvk)
+        hist.putHistory(data, sk, psk, fakeUrls)
+
+        calls = []
+        verify64u = signing.verify64u
+        monkeypatch.setattr(signing, "verify64u", lambda *args: calls.append(args) or verify64u(*args))
+
+        updated, results = event.getHistoryEvents(data["id"], fakeUrls, known=events["events"])
+
+        assert len(calls) == 2  # only the signer and rotation signatures of the new event
+        assert sorted(updated["events"].keys()) == ["0", "1", "2", "3", "4"]
+        for index, known in events["events"].items():
+            assert updated["events"][index] == known
+
+        forged = dict(events["events"])
+        forged["0"] = {"history": dict(forged["0"]["history"], changed="forged"),
+                       "signatures": forged["0"]["signatures"]}
+        del calls[:]
+
+        updated, results = event.getHistoryEvents(data["id"], fakeUrls, known=forged)
+
+        assert len(calls) == 3  # event 0 differs from the known event so it is verified
+        assert updated["events"]["0"] == events["events"]["0"]
+    finally:
+        for server in servers:
+            server.stop()
+
+
+def testGetHistoryEventsPrefix():
+    servers = [serving.FakeServer().start() for i in range(3)]
+    fakeUrls = [server.url for server in servers]
+
+    try:
+        data, vk, sk, pvk, psk = gen.historyGen()
+        hist.postHistory(data, sk, fakeUrls)
+        for i in range(4):
+            nvk, nsk, ndid = gen.keyGen()
+            data["signer"] += 1
+            data["signers"].append(nvk)
+            hist.putHistory(data, sk, psk, fakeUrls)
+            sk, psk = psk, nsk
+
+        chain = servers[0].events[data["id"]]
+        servers[1].store(serving.EVENT, data["id"], chain[:4])  # lagging servers
+        servers[2].store(serving.EVENT, data["id"], chain[:3])
+
+        events, results = event.getHistoryEvents(data["id"], fakeUrls)
+
+        assert events is None
+
+        events, results = event.getHistoryEvents(data["id"], fakeUrls, prefix=True)
+
+        assert events["divergence"] == 4
+        assert sorted(events["events"].keys()) == ["0", "1", "2", "3"]
+        assert events["events"]["3"]["history"] == chain[3]["event"]
+
+        servers[2].store(serving.EVENT, data["id"], chain)
+        events, results = event.getHistoryEvents(data["id"], fakeUrls, prefix=True)
+
+        assert events["divergence"] is None
+        assert len(events["events"]) == 5
+    finally:
+        for server in servers:
+            server.stop()
@@ -1,3 +1,5 @@
+import asyncio
+import time
 import pytest
 
 try:
@@ -10,8 +12,11 @@ from ioflo.aio.http import Valet
 # import didery.routing
 
 from diderypy.help import helping as h
+from diderypy.help import signing as sign
+from diderypy.help import transporting as t
 from diderypy.lib import generating as gen
 from diderypy.lib import historying as hist
+from tests.data import serving
 
 history, vk1, sk1, vk2, sk2 = gen.historyGen()
 vk3, sk3, did3 = gen.keyGen()
@@ -54,6 +59,180 @@ def testGetHistory():
     assert data['history'] == history
 
 
+def testGetHistoryQuorum():
+    servers = [serving.FakeServer().start() for i in range(3)]
+    fakeUrls = [server.url for server in servers]
+
+    try:
+        data, vk, sk, pvk, psk = gen.historyGen()
+        hist.postHistory(data, sk, fakeUrls)
+        servers[2].latency = 2.0
+
+        start = time.monotonic()
+        history, results = hist.getHistory(data["id"], fakeUrls, quorum=True)
+
+        assert time.monotonic() - start < 1.0  # returned without waiting for the slow server
+        assert history["history"] == data
+        assert sorted(results.keys()) == sorted("{0}/history/{1}".format(url, data["id"]) for url in fakeUrls[:2])
+    finally:
+        for server in servers:
+            server.stop()
+
+
+def testAwaitHistory():
+    servers = [serving.FakeServer().start() for i in range(3)]
+    fakeUrls = [server.url for server in servers]
+
+    async def resolve(did):
+        history, results = await hist.awaitHistory(did, fakeUrls, quorum=True)
+        streamed = [data async for did, data, results in hist.iterateHistories([did], fakeUrls)]
+        synced, results = hist.getHistory(did, fakeUrls)  # blocks the loop but does not fail
+        t.getPool().close()  # connections opened on this loop
+
+        return history, streamed, synced
+
+    try:
+        data, vk, sk, pvk, psk = gen.historyGen()
+        hist.postHistory(data, sk, fakeUrls)
+
+        for transport in t.TRANSPORTS:
+            t.setTransport(transport)
+            loop = asyncio.new_event_loop()
+
+            try:
+                history, streamed, synced = loop.run_until_complete(resolve(data["id"]))
+            finally:
+                loop.close()
+
+            assert history["history"] == data
+            assert streamed[0]["history"] == data
+            assert synced["history"] == data
+    finally:
+        t.setTransport(t.IOFLO)
+        for server in servers:
+            server.stop()
+
+
+def testGetHistories():
+    histories = hist.getHistories([did, did3], urls)
+
+    assert histories[did][0]['history'] == history
+    assert histories[did3][0] is None
+
+
+def testGetHistoriesNoUrls():
+    with pytest.raises(ValueError) as ex:
+        hist.getHistories([did], None)
+
+
+def testStreamHistories():
+    servers = [serving.FakeServer().start() for i in range(3)]
+    fakeUrls = [server.url for server in servers]
+
+    try:
+        histories = []
+        for i in range(5):
+            data, vk, sk, pvk, psk = gen.historyGen()
+            hist.postHistory(data, sk, fakeUrls)
+            histories.append(data)
+
+        servers[0].latency = 0.2
+        pulled = []
+
+        def dids():
+            for data in histories:
+                pulled.append(data["id"])
+                yield data["id"]
+            pulled.append("did:dad:missing")
+            yield "did:dad:missing"
+
+        stream = hist.streamHistories(dids(), fakeUrls, limit=3, quorum=True)
+        first = next(stream)
+
+        assert first[0] == histories[0]["id"]
+        assert first[1]["history"] == histories[0]
+        assert len(pulled) < len(histories)  # dids are only pulled as capacity frees up
+
+        rest = dict((did, (data, results)) for did, data, results in stream)
+
+        assert len(rest) == len(histories)
+        assert rest["did:dad:missing"][0] is None
+        for data in histories[1:]:
+            assert rest[data["id"]][0]["history"] == data
+    finally:
+        for server in servers:
+            server.stop()
+
+
+def testStreamHistoriesSlowConsumer():
+    servers = [serving.FakeServer().start() for i in range(3)]
+    fakeUrls = [server.url for server in servers]
+    dids = []
+    for stored in ([0, 1], [0, 2]):  # the second did needs the answer of the slow third server
+        data, vk, sk, pvk, psk = gen.historyGen()
+        hist.postHistory(data, sk, [fakeUrls[i] for i in stored])
+        dids.append(data["id"])
+
+    servers[2].latency = 0.6
+    t.setTimeout(1.0)
+
+    try:
+        stream = hist.streamHistories(dids, fakeUrls, limit=6, quorum=True)
+        assert next(stream)[0] == dids[0]
+
+        time.sleep(2.0)  # the second did's requests keep being served meanwhile
+
+        limiter = t.getLimiter()
+        assert limiter is None or limiter.active == 0
+
+        did, data, results = next(stream)
+        assert did == dids[1]
+        assert data is not None
+        assert data["history"]["id"] == did
+        stream.close()
+    finally:
+        t.setTimeout(t.DEFAULT_TIMEOUT)
+        for server in servers:
+            server.stop()
+
+
+def testStreamHistoriesNoUrls():
+    with pytest.raises(ValueError) as ex:
+        hist.streamHistories([did], [])
+
+
+@pytest.mark.parametrize("transport", [t.IOFLO, t.ASYNCIO])
+def testWritesSendSignedBytes(transport):
+    servers = [serving.FakeServer().start() for i in range(2)]
+    fakeUrls = [server.url for server in servers]
+    bodies = []
+
+    for server in servers:
+        def respond(method, path, headers, body, respond=server._respond):
+            bodies.append((headers.get("content-type"), headers.get("signature"), body))
+            return respond(method, path, headers, body)
+
+        server._respond = respond
+
+    t.setTransport(transport)
+    try:
+        data, vk, sk, pvk, psk = gen.historyGen()
+        data["note"] = "r\u00e9sum\u00e9"  # must not be escaped differently from the signed bytes
+        hist.postHistory(data, sk, fakeUrls)
+    finally:
+        t.setTransport(t.IOFLO)
+        for server in servers:
+            server.stop()
+
+    signed = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+    assert len(bodies) == 2
+    for contentType, signature, body in bodies:
+        assert contentType == "application/json; charset=utf-8"
+        assert body == signed
+        assert sign.verify64u(serving.parseSignatures(signature)["signer"], body, vk)
+
+
 def testGetHistoryNoUrls():
     with pytest.raises(ValueError) as ex:
         hist.getHistory(did, None)
@@ -1,3 +1,5 @@
+import asyncio
+import time
 import pytest
 
 try:
@@ -11,6 +13,7 @@ from ioflo.aio.http import Valet
 
 from diderypy.lib import generating as gen
 from diderypy.lib import otping as otp
+from tests.data import serving
 
 vk, sk, did = gen.keyGen()
 otpData = {
@@ -56,6 +59,51 @@ def testGetOtpBlob():
     assert data['otp_data'] == otpData
 
 
+def testGetOtpBlobQuorum():
+    servers = [serving.FakeServer().start() for i in range(3)]
+    fakeUrls = [server.url for server in servers]
+
+    try:
+        otp.postOtpBlob(dict(otpData), sk, fakeUrls)
+        servers[2].latency = 2.0
+
+        start = time.monotonic()
+        data, results = otp.getOtpBlob(did, fakeUrls, quorum=True)
+
+        assert time.monotonic() - start < 1.0  # returned without waiting for the slow server
+        assert data["otp_data"]["blob"] == otpData["blob"]
+        assert sorted(results.keys()) == sorted("{0}/blob/{1}".format(url, did) for url in fakeUrls[:2])
+    finally:
+        for server in servers:
+            server.stop()
+
+
+def testAwaitOtpBlob():
+    servers = [serving.FakeServer().start() for i in range(3)]
+    fakeUrls = [server.url for server in servers]
+
+    async def resolve():
+        awaited, results = await otp.awaitOtpBlob(did, fakeUrls, selective=True)
+        synced, results = otp.getOtpBlob(did, fakeUrls)  # blocks the loop but does not fail
+
+        return awaited, synced
+
+    try:
+        otp.postOtpBlob(dict(otpData), sk, fakeUrls)
+        loop = asyncio.new_event_loop()
+
+        try:
+            awaited, synced = loop.run_until_complete(resolve())
+        finally:
+            loop.close()
+
+        assert awaited["otp_data"]["blob"] == otpData["blob"]
+        assert synced["otp_data"]["blob"] == otpData["blob"]
+    finally:
+        for server in servers:
+            server.stop()
+
+
 def testGetOtpBlobNoUrls():
     with pytest.raises(ValueError) as ex:
         otp.getOtpBlob(did, None)
@@ -232,3 +232,54 @@ def testResponseFactoryWtihBadData():
 
     assert type(response) == resp.DideryResponse
     assert type(response.response) == resp.AbstractDideryData
+
+
+def testHistoryDataMemoizesDerivedValues(monkeypatch):
+    datum = gen.historyGen()
+    bHistory = json.dumps(datum[HISTORY], ensure_ascii=False, separators=(',', ':')).encode()
+    signature = signing.signResource(bHistory, gen.key64uToKey(datum[SK1]))
+
+    data = {
+        "history": datum[HISTORY],
+        "signatures": {
+            "signer": signature
+        }
+    }
+
+    calls = []
+    verify64u = resp.verify64u
+
+    def countingVerify(signature, message, verkey):
+        calls.append(signature)
+        return verify64u(signature, message, verkey)
+
+    monkeypatch.setattr(resp, "verify64u", countingVerify)
+
+    history = resp.HistoryData(data)
+
+    assert history.bbody is history.bbody
+    assert history.bdata is history.bdata
+    assert history.valid is True
+    assert history.valid is True
+    assert len(calls) == 1
+
+
+def testDigestIgnoresFormatting():
+    datum = gen.historyGen()
+    bHistory = json.dumps(datum[HISTORY], ensure_ascii=False, separators=(',', ':')).encode()
+    signature = signing.signResource(bHistory, gen.key64uToKey(datum[SK1]))
+
+    data = {
+        "history": datum[HISTORY],
+        "signatures": {
+            "signer": signature
+        }
+    }
+    pretty = json.dumps(data, indent=4, sort_keys=True)
+    other = resp.HistoryData(json.loads(pretty))
+
+    assert resp.HistoryData(data).digest == other.digest
+
+    data["signatures"]["rotation"] = signature
+
+    assert resp.HistoryData(data).digest != other.digest